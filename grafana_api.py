@@ -1,22 +1,192 @@
 import os
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import grafana_template
+import grafana_variables
+import utils
+import threading
+import hashlib
 import json
-import re
+
+
+# 面板信息的计算方式变化时递增，旧格式的本地缓存不再使用
+CACHE_FORMAT = 3
+
+# 所有 Grafana API 请求共用的 HTTP 会话，复用 keep-alive 连接
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """获取共用的 requests.Session，连接池大小与 GF_CONCURRENCY 一致"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = utils.new_session(utils.get_env_int("GF_CONCURRENCY", 8, minimum=1))
+        return _session
 
 
 class GrafanaApi:
+    """
+    仪表板 JSON 及由它计算出的面板信息缓存在本地（GF_DASHBOARD_CACHE_DIR），按 uid 存放；
+    创建对象时只查询最新版本号，版本没有变化时不再下载和解析仪表板 JSON
+    """
     def __init__(self, url, api_key, uid):
         self.url = url
         self.api_key = api_key
         self.uid = uid
+        self.headers = {"Authorization": f"Bearer {self.api_key}"}
+        self.use_cache = os.getenv("GF_DASHBOARD_CACHE", "True") != "False"
+        self.cache_dir = os.getenv("GF_DASHBOARD_CACHE_DIR", ".dashboard_cache")
+        self._dashboard_json = None
+        self._variables = None
+        # 通过 resolve_variables 从 Prometheus 解析变量后，面板信息的缓存与变量值对应
+        self.variables_digest = None
+        # {'format': 缓存格式, 'version': 版本号, 'derived': {名称: 计算结果}}
+        self.meta = None
+
+        if self.use_cache:
+            meta = self._read_cache("meta")
+            if meta and meta.get('format') == CACHE_FORMAT and meta.get('version') is not None \
+                    and meta['version'] == self.get_latest_version():
+                print(f"仪表板 {self.uid} 版本 {meta['version']} 没有变化，使用本地缓存")
+                self.meta = meta
+        if self.meta is None:
+            self._fetch_dashboard()
+
+
+
+    def _cache_file(self, name):
+        return os.path.join(self.cache_dir, f"{self.uid}.{name}.json")
+
+
+    def _read_cache(self, name):
+        try:
+            with open(self._cache_file(name), 'r', encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+    def _write_cache(self, name, data):
+        if not self.use_cache:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 先写临时文件再改名，避免其他进程读到不完整的文件
+        path = self._cache_file(name)
+        with open(path + ".tmp", 'w', encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+
+    def _fetch_dashboard(self):
+        """获取仪表板 JSON 数据，请求失败或返回的不是 JSON 时视为空仪表板，不写入缓存"""
+        try:
+            response = get_session().get(
+                url = f"{self.url}" + f"/api/dashboards/uid/{self.uid}",
+                headers=self.headers,
+                timeout=60
+            )
+            self._dashboard_json = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"获取仪表板 {self.uid} 失败: {str(e)}")
+            self._dashboard_json = {}
+        if not isinstance(self._dashboard_json, dict):
+            self._dashboard_json = {}
+        self.meta = {'format': CACHE_FORMAT, 'version': self._dashboard_json.get('dashboard', {}).get('version'), 'derived': {}}
+        if self.meta['version'] is not None:
+            self._write_cache("dashboard", self._dashboard_json)
+            self._write_cache("meta", self.meta)
+
+
+    def get_latest_version(self):
+        """
+        通过 /api/dashboards/uid/{uid}/versions 查询最新版本号，只返回很小的版本列表，不下载仪表板 JSON
+        查询失败时返回 None
+        """
+        try:
+            response = get_session().get(
+                url = f"{self.url}/api/dashboards/uid/{self.uid}/versions",
+                params={'limit': 1},
+                headers=self.headers,
+                timeout=30
+            )
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"查询仪表板 {self.uid} 版本失败: {str(e)}")
+            return None
+        # Grafana 11 起返回 {"versions": [...]}，之前的版本直接返回列表
+        versions = data.get('versions', []) if isinstance(data, dict) else data
+        if not isinstance(versions, list) or not versions:
+            return None
+        return versions[0].get('version')
+
+
+    @property
+    def dashboard_json(self):
+        """仪表板 JSON，使用缓存时在第一次访问时才从磁盘读取"""
+        if self._dashboard_json is None:
+            self._dashboard_json = self._read_cache("dashboard")
+            if self._dashboard_json is None:
+                self._fetch_dashboard()
+        return self._dashboard_json
+
+
+    def _derived(self, name, compute, depends=None):
+        """
+        由仪表板 JSON 计算出的结果，与版本号一起缓存
+        depends: 结果依赖的其他输入（例如变量值的摘要），与缓存时不同则重新计算
+        """
+        entry = self.meta['derived'].get(name)
+        if entry is None or entry.get('depends') != depends:
+            entry = {'depends': depends, 'value': compute()}
+            self.meta['derived'][name] = entry
+            if self.meta['version'] is not None:
+                self._write_cache("meta", self.meta)
+        return entry['value']
+
+
+
+    def get_dashboard_version(self):
+        """仪表板 JSON 的版本号，仪表板每次保存都会递增"""
+        return self.meta['version']
+
+
+
+    def get_template_variables(self):
+        """
+        从Grafana JSON中提取所有变量，整个仪表板只提取一次
+
+        Returns:
+            变量字典，键为变量名，值为当前值，多选变量的值为列表
+        """
+        if self._variables is None:
+            variables = {}
+            for template_var in self.dashboard_json.get('dashboard', {}).get('templating', {}).get('list', []):
+                var_name = template_var.get('name')
+                current_value = template_var.get('current', {}).get('value')
+
+                if var_name:
+                    # 处理多选值
+                    if isinstance(current_value, list):
+                        variables[var_name] = [str(v) for v in current_value]
+                    else:
+                        variables[var_name] = str(current_value)
+            self._variables = variables
+        return self._variables
+
 
-        """获取仪表板 JSON 数据"""
-        response = requests.get(
-            url = f"{self.url}" + f"/api/dashboards/uid/{self.uid}",
-            headers={"Authorization": f"Bearer {self.api_key}"}
-        )
-        self.dashboard_json = response.json()
+
+    def resolve_variables(self, start, end):
+        """
+        从 Prometheus 查询 query 类型变量的可选值，代替仪表板中保存的 current 值（见 grafana_variables）
+        start, end: Prometheus 格式的时间范围
+        """
+        template_list = self.dashboard_json.get('dashboard', {}).get('templating', {}).get('list', [])
+        self._variables = grafana_variables.VariableResolver(template_list, start, end).resolve()
+        self.variables_digest = hashlib.sha256(json.dumps(self._variables, sort_keys=True).encode('utf-8')).hexdigest()
+        return self._variables
 
 
 
@@ -24,52 +194,22 @@ class GrafanaApi:
         """
         从Grafana JSON中提取所有变量
         
-        Args:
-            dashboard_json: Grafana Dashboard JSON数据
-        
         Returns:
-            变量字典，键为变量名，值为当前值
+            变量字典，键为变量名，值为当前值，多选值用 | 连接
         """
-        variables = {}
-        for template_var in self.dashboard_json.get('dashboard', {}).get('templating', {}).get('list', []):
-            var_name = template_var.get('name')
-            current_value = template_var.get('current', {}).get('value')
-            
-            if var_name:
-                # 处理多选值
-                if isinstance(current_value, list):
-                    variables[var_name] = '|'.join([str(v) for v in current_value])
-                else:
-                    variables[var_name] = str(current_value)
-        
-        return variables
+        return {name: '|'.join(value) if isinstance(value, list) else value for name, value in self.get_template_variables().items()}
 
 
 
     def replace_variables_in_query(self, query):
         """
-        从Grafana JSON中提取并替换变量
-        
-        Args:
-            dashboard_json: Grafana Dashboard JSON数据
-            variable_values: 可选的变量值字典，用于覆盖当前值
-        
+        替换查询中的仪表板变量，支持 $var、${var}、${var:format}、[[var]]
+        $__range、$__interval 等内置变量与时间范围有关，保持原样，查询时由 prometheus_data 替换
+
         Returns:
-            替换后的查询列表
+            替换后的查询语句
         """
-        variables = self.get_grafana_variables()
-
-        """替换查询中的变量占位符"""
-        # Grafana变量格式: $variable 或 ${variable:format}
-        pattern = r'\$(\w+)(?::[^}]*)?|\$\{(\w+)(?::[^}]*)?\}'
-        
-        def replace_match(match):
-            var_name = match.group(1) or match.group(2)
-            if var_name in variables:
-                return variables[var_name]
-            return match.group(0)  # 未找到变量，保持原样
-        
-        return re.sub(pattern, replace_match, query)
+        return grafana_template.render(query, self.get_template_variables())
 
 
 
@@ -80,6 +220,11 @@ class GrafanaApi:
         """提取面板信息，排除行类型的面板，并正确处理展开和折叠的行
         return: [{'id': 23763571997, 'title': '域名状态明细', 'description': '', 'type': 'table', 'row': 'DK数字钥匙域名监控'}, {'id': 68, 'title': 'HTTP总访问量', 'description': None, 'type': 'stat', 'row': 'DK数字钥匙域名监控'}]
         """
+        return self._derived('panel_info', self._extract_panel_info, self.variables_digest)
+
+
+
+    def _extract_panel_info(self):
         panels_info = []
         current_row = None
 
@@ -100,6 +245,8 @@ class GrafanaApi:
                         'description': panel.get('description'),
                         'type': panel.get('type'),
                         'expr': [] if 'targets' not in panel else [self.replace_variables_in_query(target['expr']) for target in panel['targets']],
+                        'interval': panel.get('interval'),
+                        'maxDataPoints': panel.get('maxDataPoints'),
                         'row': parent_row['title'] if parent_row else None
                     })
 
@@ -111,6 +258,116 @@ class GrafanaApi:
 
 
 
+    def extract_panel_layout(self):
+        """计算所有行都展开后每个面板在网格中的位置
+        Grafana 网格为 24 列，折叠行中的面板展开后插入到行标题下方，后面的面板整体下移
+        return: {'68': {'x': 0, 'y': 1, 'w': 12, 'h': 8}, ...}，键为字符串形式的面板 id
+        """
+        return self._derived('panel_layout', self._extract_panel_layout)
+
+
+
+    def _extract_panel_layout(self):
+        layout = {}
+        offset = 0
+
+        def grid_pos(panel):
+            pos = panel.get('gridPos', {})
+            return {'x': pos.get('x', 0), 'y': pos.get('y', 0), 'w': pos.get('w', 12), 'h': pos.get('h', 8)}
+
+        panels = self.dashboard_json.get('dashboard', {}).get('panels', [])
+        for panel in sorted(panels, key=lambda p: (grid_pos(p)['y'], grid_pos(p)['x'])):
+            pos = grid_pos(panel)
+            pos['y'] += offset
+
+            if panel.get('type') == 'row':
+                sub_panels = panel.get('panels', [])
+                if panel.get('collapsed', False) and sub_panels:
+                    top = min(grid_pos(sub_panel)['y'] for sub_panel in sub_panels)
+                    bottom = pos['y'] + 1
+                    for sub_panel in sub_panels:
+                        sub_pos = grid_pos(sub_panel)
+                        sub_pos['y'] = sub_pos['y'] - top + pos['y'] + 1
+                        layout[str(sub_panel['id'])] = sub_pos
+                        bottom = max(bottom, sub_pos['y'] + sub_pos['h'])
+                    offset += bottom - (pos['y'] + 1)
+                continue
+
+            if 'id' in panel:
+                layout[str(panel['id'])] = pos
+
+        return layout
+
+
+
+def search_dashboards(url, api_key, tags=None, folder_uids=None, uids=None):
+    """
+    通过 /api/search 查找仪表板，多个条件同时指定时取交集
+
+    Args:
+        tags: 标签列表，仪表板需要包含所有标签
+        folder_uids: 文件夹 uid 列表
+        uids: 仪表板 uid 列表
+    Returns:
+        list: [{'uid': ..., 'title': ..., 'folderTitle': ..., 'tags': [...]}, ...]
+    """
+    params = [('type', 'dash-db'), ('limit', 5000)]
+    params += [('tag', tag) for tag in tags or []]
+    params += [('folderUIDs', folder_uid) for folder_uid in folder_uids or []]
+    params += [('dashboardUIDs', uid) for uid in uids or []]
+    response = get_session().get(f"{url}/api/search", params=params, headers={"Authorization": f"Bearer {api_key}"}, timeout=60)
+    dashboards = response.json()
+    if not isinstance(dashboards, list):
+        print(f"查找仪表板失败: {dashboards}")
+        return []
+    print(f"找到 {len(dashboards)} 个仪表板: {[d.get('title') for d in dashboards]}")
+    return dashboards
+
+
+def load_dashboards(url, api_key, uids, start=None, end=None, concurrency=None):
+    """
+    并发获取多个仪表板，start/end 不为空时同时从 Prometheus 解析模板变量（见 GrafanaApi.resolve_variables）
+    获取失败的仪表板跳过
+
+    Returns:
+        list: 与 uids 顺序一致的 GrafanaApi 对象
+    """
+    def load(uid):
+        try:
+            dashboard = GrafanaApi(url, api_key, uid)
+            if start and end:
+                dashboard.resolve_variables(start, end)
+            dashboard.extract_panel_info()
+            return dashboard
+        except Exception as e:
+            print(f"获取仪表板 {uid} 失败: {str(e)}")
+            return None
+
+    if not uids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(concurrency or utils.get_env_int("GF_CONCURRENCY", 8, minimum=1), len(uids))) as executor:
+        return [dashboard for dashboard in executor.map(load, uids) if dashboard is not None]
+
+
+def collect_panels(dashboards, titles=None):
+    """
+    合并多个仪表板的面板，交给同一个截图和查询流程
+    每个面板增加 uid 和 version；多个仪表板时面板标题前加上仪表板名称，避免截图文件重名
+
+    Args:
+        titles: {uid: 仪表板名称}，默认使用 uid
+    """
+    panels = []
+    for dashboard in dashboards:
+        for panel in dashboard.extract_panel_info():
+            panel = dict(panel, uid=dashboard.uid, version=dashboard.get_dashboard_version())
+            if len(dashboards) > 1:
+                panel['title'] = f"{(titles or {}).get(dashboard.uid, dashboard.uid)} - {panel['title']}"
+            panels.append(panel)
+    return panels
+
+
+
 if __name__ == '__main__':
     load_dotenv()
     grafana_api = GrafanaApi(
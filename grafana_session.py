@@ -0,0 +1,102 @@
+from dotenv import load_dotenv
+import requests
+import json
+import os
+import time
+
+
+def get_session_file():
+    return os.getenv("GF_SESSION_FILE", ".grafana_session.json")
+
+
+def get_session_ttl(default=86400):
+    """会话在本地缓存的有效期（秒），默认一天，需小于 Grafana 的 login_maximum_inactive_lifetime"""
+    try:
+        return int(os.getenv("GF_SESSION_TTL", default))
+    except (TypeError, ValueError):
+        return default
+
+
+def build_token_session(url, api_key):
+    """使用 API Token 构造会话，浏览器通过请求头认证，不需要登录"""
+    return {
+        'url': url,
+        'cookies': [],
+        'headers': {'Authorization': f"Bearer {api_key}"},
+        'expires_at': None
+    }
+
+
+def build_cookie_session(url, cookies, ttl=None):
+    """根据浏览器登录后的 cookie 构造会话"""
+    ttl = get_session_ttl() if ttl is None else ttl
+    # 只保留 add_cookie 支持的字段
+    keep = ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry', 'sameSite')
+    return {
+        'url': url,
+        'cookies': [{k: v for k, v in c.items() if k in keep} for c in cookies],
+        'headers': {},
+        'expires_at': time.time() + ttl
+    }
+
+
+def check_session(session, timeout=10):
+    """通过 /api/user 检查会话是否仍然有效"""
+    try:
+        response = requests.get(
+            url=session['url'] + "/api/user",
+            headers=session.get('headers', {}),
+            cookies={c['name']: c['value'] for c in session.get('cookies', [])},
+            timeout=timeout
+        )
+        return response.status_code == 200
+    except Exception as e:
+        print(f"检查 Grafana 会话失败: {str(e)}")
+        return False
+
+
+def load_session(url, validate=True):
+    """
+    从磁盘读取缓存的会话
+
+    Returns:
+        会话字典，文件不存在、已过期、Grafana 地址不一致或校验失败时返回 None
+    """
+    session_file = get_session_file()
+    if not os.path.exists(session_file):
+        return None
+
+    try:
+        with open(session_file, 'r', encoding="utf-8") as f:
+            session = json.load(f)
+    except Exception as e:
+        print(f"读取会话文件失败: {str(e)}")
+        return None
+
+    if session.get('url') != url:
+        return None
+    if session.get('expires_at') and session['expires_at'] < time.time():
+        print("缓存的 Grafana 会话已过期")
+        return None
+    if validate and not check_session(session):
+        print("缓存的 Grafana 会话已失效")
+        return None
+
+    print(f"使用缓存的 Grafana 会话: {session_file}")
+    return session
+
+
+def save_session(session):
+    """将会话写入磁盘，仅当前用户可读"""
+    session_file = get_session_file()
+    fd = os.open(session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding="utf-8") as f:
+        json.dump(session, f, indent=4, ensure_ascii=False)
+    print(f"Grafana 会话保存到：{session_file}")
+
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    session = load_session(os.getenv("GF_URL"))
+    print(session is not None)
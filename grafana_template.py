@@ -0,0 +1,123 @@
+"""
+Grafana 模板变量替换
+
+支持 $var、${var}、${var:format}、[[var]]、[[var:format]] 以及内置变量 $__range、$__interval、$__rate_interval 等。
+查询语句只解析一次，编译结果按语句缓存，同一语句在不同时间范围、不同变量值下重复使用。
+"""
+from functools import lru_cache
+import json
+import re
+
+
+# Grafana 变量的三种写法
+VARIABLE_PATTERN = re.compile(r'\$\{(\w+)(?::([^}]*))?\}|\[\[(\w+)(?::(\w+))?\]\]|\$(\w+)')
+REGEX_SPECIAL = re.compile(r'[\\^$*+?.()|{}\[\]/]')
+
+
+def regex_escape(value):
+    return REGEX_SPECIAL.sub(lambda m: '\\' + m.group(0), str(value))
+
+
+def format_value(value, fmt=None):
+    """
+    按 Grafana 的格式化选项格式化变量值
+    value 为字符串或列表（多选变量），没有指定格式时与 Prometheus 数据源一致：多个值转义后用 (a|b) 连接
+    """
+    values = value if isinstance(value, list) else [value]
+    values = [str(v) for v in values]
+    if fmt in (None, '', 'raw'):
+        if len(values) == 1:
+            return values[0]
+        return '(' + '|'.join(regex_escape(v) for v in values) + ')'
+    if fmt == 'regex':
+        return regex_escape(values[0]) if len(values) == 1 else '(' + '|'.join(regex_escape(v) for v in values) + ')'
+    if fmt == 'pipe':
+        return '|'.join(values)
+    if fmt == 'csv':
+        return ','.join(values)
+    if fmt == 'glob':
+        return values[0] if len(values) == 1 else '{' + ','.join(values) + '}'
+    if fmt == 'json':
+        return json.dumps(values if isinstance(value, list) else values[0], ensure_ascii=False)
+    if fmt == 'singlequote':
+        return ','.join("'" + v.replace("'", "\\'") + "'" for v in values)
+    if fmt == 'doublequote':
+        return ','.join('"' + v.replace('"', '\\"') + '"' for v in values)
+    if fmt == 'text':
+        return ' + '.join(values)
+    print(f"不支持的变量格式: {fmt}，按原值替换")
+    return '|'.join(values)
+
+
+class Template:
+    """编译后的查询语句：字符串片段与变量引用交替排列"""
+    def __init__(self, text):
+        self.text = text
+        # 片段为字符串或 (变量名, 格式, 原文)
+        self.parts = []
+        pos = 0
+        for match in VARIABLE_PATTERN.finditer(text):
+            if match.start() > pos:
+                self.parts.append(text[pos:match.start()])
+            name = match.group(1) or match.group(3) or match.group(5)
+            fmt = match.group(2) or match.group(4)
+            self.parts.append((name, fmt, match.group(0)))
+            pos = match.end()
+        if pos < len(text):
+            self.parts.append(text[pos:])
+        self.names = {part[0] for part in self.parts if isinstance(part, tuple)}
+
+
+    def render(self, *scopes):
+        """
+        依次在 scopes（变量字典）中查找变量，找不到的变量保持原样
+        """
+        output = []
+        for part in self.parts:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+            name, fmt, raw = part
+            for scope in scopes:
+                if name in scope:
+                    output.append(format_value(scope[name], fmt))
+                    break
+            else:
+                output.append(raw)
+        return ''.join(output)
+
+
+@lru_cache(maxsize=4096)
+def compile_template(text):
+    return Template(text)
+
+
+def render(text, *scopes):
+    """替换 text 中的变量，等同于 compile_template(text).render(*scopes)"""
+    return compile_template(text).render(*scopes)
+
+
+def format_duration(seconds):
+    """将秒数转换为 Prometheus 时长，能整除时使用较大的单位，例如 300 -> 5m"""
+    seconds = int(seconds)
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def builtin_variables(range_seconds, interval_seconds, scrape_seconds):
+    """
+    与时间范围相关的内置变量，与 Grafana Prometheus 数据源一致
+    $__rate_interval = max($__interval + 采集间隔, 4 * 采集间隔)
+    """
+    range_seconds = int(range_seconds)
+    interval_seconds = int(interval_seconds)
+    return {
+        '__range': f"{range_seconds}s",
+        '__range_s': str(range_seconds),
+        '__range_ms': str(range_seconds * 1000),
+        '__interval': format_duration(interval_seconds),
+        '__interval_ms': str(interval_seconds * 1000),
+        '__rate_interval': format_duration(max(interval_seconds + scrape_seconds, 4 * scrape_seconds)),
+    }
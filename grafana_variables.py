@@ -0,0 +1,224 @@
+"""
+解析仪表板中查询类型的模板变量
+
+仪表板 JSON 中保存的 current 值可能已经过期，或者是 $__all；
+这里按 Grafana Prometheus 数据源的语法（label_values、label_names、metrics、query_result）
+直接向 Prometheus 查询变量的可选值，被其他变量引用的变量先解析，互不依赖的变量并发查询，
+同一次运行中相同的查询只请求一次。
+"""
+from concurrent.futures import ThreadPoolExecutor
+import prometheus_data
+import grafana_template
+import utils
+import threading
+import os
+import re
+
+
+LABEL_VALUES = re.compile(r'^label_values\((?:(.+),\s*)?([a-zA-Z_][a-zA-Z0-9_]*)\)\s*$', re.S)
+LABEL_NAMES = re.compile(r'^label_names\(\)\s*$')
+METRICS = re.compile(r'^metrics\((.+)\)\s*$', re.S)
+QUERY_RESULT = re.compile(r'^query_result\((.+)\)\s*$', re.S)
+
+# 本次运行中已经完成的查询 {(接口, 参数): 结果}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def prometheus_get(path, params):
+    """请求 Prometheus HTTP API，返回 data 字段，相同请求只发送一次"""
+    key = (path, tuple(sorted(params.items())))
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+
+    url = os.getenv('PROMETHEUS_URL') + path
+    timeout = utils.get_env_int("PROM_TIMEOUT", 60)
+    response = prometheus_data.get_session().get(url, params=params, timeout=timeout).json()
+    if response.get('status') != 'success':
+        raise RuntimeError(response.get('error', '查询失败'))
+
+    with _cache_lock:
+        _cache[key] = response['data']
+    return response['data']
+
+
+def run_query(query, start, end):
+    """
+    执行 Grafana Prometheus 变量查询
+    return: 可选值列表（未经过 regex 过滤）
+    """
+    query = query.strip()
+    match = LABEL_VALUES.match(query)
+    if match:
+        selector, label = match.groups()
+        params = {'start': start, 'end': end}
+        if selector:
+            params['match[]'] = selector.strip()
+        return prometheus_get(f"/api/v1/label/{label}/values", params)
+
+    if LABEL_NAMES.match(query):
+        return prometheus_get("/api/v1/labels", {'start': start, 'end': end})
+
+    match = METRICS.match(query)
+    if match:
+        pattern = re.compile(match.group(1).strip())
+        names = prometheus_get("/api/v1/label/__name__/values", {'start': start, 'end': end})
+        return [name for name in names if pattern.search(name)]
+
+    match = QUERY_RESULT.match(query)
+    if match:
+        data = prometheus_get("/api/v1/query", {'query': match.group(1).strip(), 'time': end})
+        values = []
+        for item in data.get('result', []):
+            metric = dict(item.get('metric', {}))
+            name = metric.pop('__name__', '')
+            labels = ','.join(f'{k}="{v}"' for k, v in metric.items())
+            timestamp, value = item.get('value', [0, ''])
+            values.append(f"{name}{{{labels}}} {value} {int(float(timestamp) * 1000)}")
+        return values
+
+    raise ValueError(f"不支持的变量查询: {query}")
+
+
+def apply_regex(values, regex):
+    """
+    按变量的 regex 过滤和提取可选值，与 Grafana 一致：
+    有命名分组 value/text 时取 value，有分组时取第一个分组，否则取整个值
+    """
+    if not regex:
+        return values
+    match = re.fullmatch(r'/(.*)/(\w*)', regex, re.S)
+    pattern, flags = (match.group(1), match.group(2)) if match else (regex, '')
+    # Grafana 使用 JavaScript 正则，命名分组写法为 (?<name>...)
+    pattern = re.sub(r'\(\?<(?![=!])', '(?P<', pattern)
+    pattern = re.compile(pattern, re.I if 'i' in flags else 0)
+
+    result = []
+    for value in values:
+        match = pattern.search(value)
+        if not match:
+            continue
+        groups = match.groupdict()
+        if groups.get('value') is not None or groups.get('text') is not None:
+            value = groups.get('value') or groups.get('text')
+        elif match.groups():
+            value = match.group(1)
+        if value is not None and value not in result:
+            result.append(value)
+    return result
+
+
+def sort_values(values, sort):
+    """按变量的 sort 设置排序：1/2 字母升序/降序，3/4 数字升序/降序，5/6 忽略大小写的字母升序/降序"""
+    def number(value):
+        match = re.search(r'-?\d+(\.\d+)?', value)
+        return float(match.group(0)) if match else float('inf')
+
+    if sort in (1, 2):
+        return sorted(values, reverse=sort == 2)
+    if sort in (3, 4):
+        return sorted(values, key=number, reverse=sort == 4)
+    if sort in (5, 6):
+        return sorted(values, key=str.lower, reverse=sort == 6)
+    return values
+
+
+def select_current(variable, options):
+    """
+    根据保存的 current 值选择变量的值
+    $__all 时取 allValue 或全部可选值；保存的值仍在可选值中时保留，否则与 Grafana 一样取第一个可选值
+    """
+    current = variable.get('current', {}).get('value')
+    selected = current if isinstance(current, list) else [current]
+    if '$__all' in selected:
+        return variable['allValue'] if variable.get('allValue') else list(options)
+
+    kept = [value for value in selected if value in options]
+    if kept:
+        return kept if variable.get('multi') else kept[0]
+    if not options:
+        return [] if variable.get('multi') else ''
+    return [options[0]] if variable.get('multi') else options[0]
+
+
+class VariableResolver:
+    """
+    解析仪表板模板变量
+    """
+    def __init__(self, template_list, start, end, concurrency=None):
+        """
+        Args:
+            template_list: 仪表板 JSON 中的 templating.list
+            start, end: 查询时间范围，Prometheus 格式（2025-12-02T00:00:00Z）
+        """
+        self.variables = [variable for variable in template_list if variable.get('name')]
+        self.start = start
+        self.end = end
+        self.concurrency = concurrency or utils.get_env_int("PROM_CONCURRENCY", 8)
+
+
+    @staticmethod
+    def query_text(variable):
+        query = variable.get('query', '')
+        # 新版本 Grafana 中 query 为 {'query': 'label_values(...)', 'refId': ...}
+        return query.get('query', '') if isinstance(query, dict) else str(query)
+
+
+    def levels(self):
+        """
+        按依赖关系分层，每一层的变量只引用前面层中的变量
+        循环引用的变量放在最后一层，按保存的值处理
+        """
+        names = {variable['name'] for variable in self.variables}
+        depends = {
+            variable['name']: (grafana_template.compile_template(self.query_text(variable)).names & names) - {variable['name']}
+            if variable.get('type') == 'query' else set()
+            for variable in self.variables
+        }
+
+        levels = []
+        done = set()
+        remaining = list(self.variables)
+        while remaining:
+            level = [variable for variable in remaining if depends[variable['name']] <= done]
+            if not level:
+                print(f"模板变量存在循环引用: {[variable['name'] for variable in remaining]}")
+                levels.append(remaining)
+                break
+            levels.append(level)
+            done |= {variable['name'] for variable in level}
+            remaining = [variable for variable in remaining if variable['name'] not in done]
+        return levels
+
+
+    def resolve_one(self, variable, resolved):
+        """解析单个变量，查询失败时使用保存的 current 值"""
+        current = variable.get('current', {}).get('value')
+        saved = [str(v) for v in current] if isinstance(current, list) else str(current)
+        if variable.get('type') != 'query':
+            return saved
+
+        query = grafana_template.render(self.query_text(variable), resolved)
+        try:
+            options = run_query(query, self.start, self.end)
+            options = sort_values(apply_regex([str(value) for value in options], variable.get('regex')), variable.get('sort'))
+        except Exception as e:
+            print(f"解析模板变量 {variable['name']} 失败，使用保存的值: {str(e)}")
+            return saved
+        return select_current(variable, options)
+
+
+    def resolve(self):
+        """
+        Returns:
+            dict: {变量名: 值}，多选变量的值为列表，格式与 GrafanaApi.get_template_variables 一致
+        """
+        resolved = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for level in self.levels():
+                values = list(executor.map(lambda variable: self.resolve_one(variable, dict(resolved)), level))
+                for variable, value in zip(level, values):
+                    resolved[variable['name']] = value
+                    print(f"模板变量 {variable['name']} = {value}")
+        return resolved
@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
+import grafana_api
 import prometheus_data
-import renderer_image
+import render_pool
 import utils
 import os
 import json
@@ -26,17 +27,15 @@ with open(grafana_config, 'r') as f:
     uid = panel_config['uid']
     name = panel_config['name']
 
-    # 打开浏览器
-    chrome_obj = renderer_image.GrafanaDashboard(url, username, password, uid )
-    chrome_obj.init_chromium(debug=os.getenv("CHROME_DEBUG"))
-
-    # 厂商里的每个面板
-    for panel in panel_config['panels']:
-        panel_id = panel['id']
-        panel_name = panel['title']
-        chrome_obj.render_panel(date_from=date_from, date_to=date_to, panel_id=panel_id, panel_name=panel_name)
-    # 关闭浏览器
-    chrome_obj.driver.quit()
+    # 并行截图，厂商里的每个面板分发给浏览器 worker 或 Grafana 渲染接口
+    renderer = render_pool.create_renderer(url, username, password, api_key, uid, debug=os.getenv("CHROME_DEBUG"))
+    # 仪表板版本用于截图缓存，版本变化时旧截图失效；不使用截图缓存或没有 API Token 时不查询仪表板
+    version = None
+    if api_key and render_pool.use_render_cache(date_from, date_to):
+        version = grafana_api.GrafanaApi(url, api_key, uid).get_dashboard_version()
+    manifest = render_pool.render_panels(renderer, panel_config['panels'], date_from, date_to, version)
+    render_pool.write_manifest(manifest)
+    renderer.timing.write(manifest)
 
 
 # 从配置中读取，取监控数据
@@ -47,26 +46,33 @@ with open(grafana_config, 'r') as f:
     name = panel_config['name']
     all_data = []
 
-    # 厂商里的每个面板
+    # 厂商里的每个面板，先收集所有需要查询的语句
+    start = utils.convert_to_prometheus_format(date_from)
+    end = utils.convert_to_prometheus_format(date_to)
+    queries = []
     for panel in panel_config['panels']:
-        panel_id = panel['id']
-        panel_name = panel['title']
         expr = panel['expr']
-        # prometheus 查询这个语句
-        data = prometheus_data.query_prometheus(expr, utils.convert_to_prometheus_format(date_from), utils.convert_to_prometheus_format(date_to))
+        # get_value 可以是单个统计项或列表，例如 "max" 或 ["max", "avg", "p95", "top5"]
         get_value = panel.get('get_value', 'max')
-        if get_value == 'max':
-            monitor_value = prometheus_data.get_max_value_with_labels(data)
-        elif get_value == 'min':
-            monitor_value = prometheus_data.get_min_value_with_labels(data)
-        elif get_value == 'avg':
-            monitor_value = prometheus_data.get_avg_value_with_labels(data)
-        else:
-            monitor_value = None
-        
-        if monitor_value is not None:
-            monitor_value['panel_name'] = panel_name
-            all_data.append(monitor_value)
+        stats = get_value if isinstance(get_value, list) else [get_value]
+        stats = [stat for stat in stats if prometheus_data.parse_stat(stat)[0]]
+        if expr and stats:
+            queries.append((panel, stats))
+
+    # prometheus 并发查询所有语句，每个语句一次计算所有统计项
+    responses = prometheus_data.query_stats_batch([(panel['expr'], stats, panel) for panel, stats in queries], start, end)
+
+    for (panel, stats), results in zip(queries, responses):
+        for stat in stats:
+            # top/bottom 每条序列单独一行，例如 "top5 #1"
+            if 'items' in results[stat]:
+                values = [(f"{stat} #{rank}", item) for rank, item in enumerate(results[stat]['items'], 1)]
+            else:
+                values = [(stat, results[stat])]
+            for stat_name, monitor_value in values:
+                monitor_value['panel_name'] = panel['title']
+                monitor_value['stat'] = stat_name
+                all_data.append(monitor_value)
 
     # 一次性写入所有数据到文件，移出循环
     with open(f'monitor_data.json', 'w', encoding="utf-8") as mf:
@@ -74,4 +80,4 @@ with open(grafana_config, 'r') as f:
 
 
 # 发邮件
-send_mail.send_email_now(name=name)
\ No newline at end of file
+send_mail.send_email_now(name=name, images=renderer.images)
\ No newline at end of file
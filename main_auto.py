@@ -1,7 +1,7 @@
 from dotenv import load_dotenv
 import grafana_api
 import prometheus_data
-import renderer_image
+import render_pool
 import utils
 import os
 import json
@@ -18,35 +18,53 @@ password = os.getenv("GF_PASSWORD")
 uid = os.getenv("UID")
 
 
-# 打开浏览器
-chrome_obj = renderer_image.GrafanaDashboard(url, username, password, uid )
-chrome_obj.init_chromium(debug=os.getenv("CHROME_DEBUG"))
+def split_env(name):
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
 
 # 遍历面板信息，自动获取全部数据
-grafana_obj = grafana_api.GrafanaApi(url, api_key, uid)
-extract_panel_info = grafana_obj.extract_panel_info()
+start = utils.convert_to_prometheus_format(date_from)
+end = utils.convert_to_prometheus_format(date_to)
+print(start, end)
+# 设置了 GF_SEARCH_TAGS / GF_SEARCH_FOLDERS / GF_UIDS 时通过 /api/search 查找多个仪表板，在一个进程中一起处理；否则只处理 UID
+tags, folders, uids = split_env("GF_SEARCH_TAGS"), split_env("GF_SEARCH_FOLDERS"), split_env("GF_UIDS")
+if tags or folders or uids:
+    found = grafana_api.search_dashboards(url, api_key, tags=tags, folder_uids=folders, uids=uids)
+    titles = {d['uid']: d.get('title', d['uid']) for d in found}
+else:
+    titles = {uid: uid}
+
+# query 类型的变量从 Prometheus 解析当前时间范围内的可选值，不使用仪表板中保存的值
+resolve = os.getenv("GF_RESOLVE_VARIABLES", "False") == "True"
+dashboards = grafana_api.load_dashboards(url, api_key, list(titles), start if resolve else None, end if resolve else None)
+if not dashboards:
+    raise SystemExit("没有可处理的仪表板")
+extract_panel_info = grafana_api.collect_panels(dashboards, titles)
 print(extract_panel_info)
-for panel in extract_panel_info:
-    for expr in panel['expr']:
-        print(expr)
-        # prometheus 查询这个语句
-        print(utils.convert_to_prometheus_format(date_from), utils.convert_to_prometheus_format(date_to))
-        data = prometheus_data.query_prometheus(expr, utils.convert_to_prometheus_format(date_from), utils.convert_to_prometheus_format(date_to))
 
-        max_info = prometheus_data.get_max_value_with_labels(data)
-        if max_info['max_value'] is not None:
-            print(max_info)
+# prometheus 并发查询所有面板的语句
+queries = [(panel, expr) for panel in extract_panel_info for expr in panel['expr']]
+responses = prometheus_data.query_stats_batch([(expr, ['max'], panel) for panel, expr in queries], start, end)
+
+for (panel, expr), results in zip(queries, responses):
+    print(expr)
+    max_info = results['max']
+    if max_info['value'] is not None:
+        print(max_info)
 
-            with open(f"1.log", "a", encoding="utf-8") as f:
-                max_info['panel_title'] = panel['title']
-                json.dump(max_info, f, indent=4, ensure_ascii=False)
+        with open(f"1.log", "a", encoding="utf-8") as f:
+            max_info['panel_title'] = panel['title']
+            json.dump(max_info, f, indent=4, ensure_ascii=False)
 
-            print(f"最大值: {max_info['max_value']}")
-            print(f"最大值出现时间: {max_info['timestamp_formatted']}")
-    chrome_obj.render_panel(date_from=date_from, date_to=date_to, panel_id=panel['id'], panel_name=panel['title'])
+        print(f"最大值: {max_info['value']}")
+        print(f"最大值出现时间: {max_info['timestamp_formatted']}")
 
-# 关闭浏览器
-chrome_obj.driver.quit()
+# 并行截图
+renderer = render_pool.create_renderer(url, username, password, api_key, dashboards[0].uid if len(dashboards) == 1 else "multi",
+                                       debug=os.getenv("CHROME_DEBUG"))
+manifest = render_pool.render_panels(renderer, extract_panel_info, date_from, date_to)
+render_pool.write_manifest(manifest)
+renderer.timing.write(manifest)
 
 # 发送邮件
-send_mail.send_email_now(name="自动巡检报告")
+send_mail.send_email_now(name="自动巡检报告", images=renderer.images)
@@ -0,0 +1,237 @@
+"""
+面板加载完成检测
+
+通过 Chrome DevTools 在每个页面加载前注入脚本：
+  - 包装 fetch / XMLHttpRequest，统计面板数据请求（/api/ds/query 等）的进行中数量和错误
+  - 使用 MutationObserver 记录页面最后一次变化的时间，以及面板或仪表板网格第一次出现的时间
+数据请求全部结束且页面在 quiet_ms 内没有再变化，即认为面板已经绘制完成。
+不依赖 Grafana 各版本中带哈希的 CSS 类名。
+"""
+
+READY_SCRIPT = r"""
+(function () {
+    if (window.__panelReady) {
+        return;
+    }
+    var DATA_URL = /\/api\/(ds\/query|datasources\/proxy\/|datasources\/uid\/[^\/]+\/resources\/|tsdb\/query)/;
+    // Grafana 前端挂载面板后才会出现的元素：仪表板网格、旧版本的 data-panelid、Scenes 版本的 data-viz-panel-key
+    var PANEL_SELECTOR = '.react-grid-layout, [data-panelid], [data-viz-panel-key], [data-testid^="data-testid Panel header"]';
+    var state = {inflight: 0, started: 0, finished: 0, errors: [], lastChange: Date.now(), mountedAt: null};
+    var listeners = [];
+
+    function mounted() {
+        if (state.mountedAt === null && document.querySelector && document.querySelector(PANEL_SELECTOR)) {
+            state.mountedAt = Date.now();
+        }
+        return state.mountedAt !== null;
+    }
+    function touch() {
+        state.lastChange = Date.now();
+        mounted();
+        listeners.slice().forEach(function (fn) { fn(); });
+    }
+    function begin() {
+        state.inflight++;
+        state.started++;
+        touch();
+    }
+    function end() {
+        state.inflight = Math.max(0, state.inflight - 1);
+        state.finished++;
+        touch();
+    }
+    function checkBody(url, body) {
+        // /api/ds/query 返回 200 时，单个查询的错误放在 results.<refId>.error 中
+        var results = body && body.results;
+        if (!results) {
+            return;
+        }
+        Object.keys(results).forEach(function (refId) {
+            if (results[refId] && results[refId].error) {
+                state.errors.push(url + ' ' + refId + ': ' + results[refId].error);
+            }
+        });
+    }
+
+    var origFetch = window.fetch;
+    window.fetch = function (input, init) {
+        var url = typeof input === 'string' ? input : (input && input.url) || '';
+        if (!DATA_URL.test(url)) {
+            return origFetch.apply(this, arguments);
+        }
+        begin();
+        return origFetch.apply(this, arguments).then(function (resp) {
+            if (!resp.ok) {
+                state.errors.push(url + ' ' + resp.status);
+                end();
+                return resp;
+            }
+            resp.clone().json().then(function (body) { checkBody(url, body); }).catch(function () {}).then(end);
+            return resp;
+        }, function (err) {
+            state.errors.push(url + ' ' + String(err));
+            end();
+            throw err;
+        });
+    };
+
+    var origOpen = XMLHttpRequest.prototype.open;
+    var origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__panelReadyUrl = String(url);
+        return origOpen.apply(this, arguments);
+    };
+    XMLHttpRequest.prototype.send = function () {
+        var xhr = this;
+        if (DATA_URL.test(xhr.__panelReadyUrl || '')) {
+            begin();
+            xhr.addEventListener('loadend', function () {
+                if (xhr.status >= 400 || xhr.status === 0) {
+                    state.errors.push(xhr.__panelReadyUrl + ' ' + xhr.status);
+                }
+                end();
+            });
+        }
+        return origSend.apply(this, arguments);
+    };
+
+    function observe() {
+        new MutationObserver(touch).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    }
+    if (document.documentElement) {
+        observe();
+    } else {
+        document.addEventListener('DOMContentLoaded', observe);
+    }
+
+    window.__panelReady = {
+        state: state,
+        subscribe: function (fn) { listeners.push(fn); },
+        unsubscribe: function (fn) { listeners = listeners.filter(function (l) { return l !== fn; }); },
+        mounted: mounted,
+        reset: function () {
+            state.started = 0;
+            state.finished = 0;
+            state.errors = [];
+            state.mountedAt = null;
+            touch();
+        }
+    };
+})();
+"""
+
+# 由事件驱动的等待：每次请求结束或页面变化都会重新安排一次检查，不轮询 DOM
+WAIT_SCRIPT = r"""
+var quietMs = arguments[0], timeoutMs = arguments[1], noRequestMs = arguments[2], done = arguments[arguments.length - 1];
+var ready = window.__panelReady;
+if (!ready) {
+    done({ready: false, installed: false, errors: [], started: 0});
+    return;
+}
+var begin = Date.now(), timer = null, finished = false;
+
+function finish(ok) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    clearTimeout(timer);
+    ready.unsubscribe(schedule);
+    var s = ready.state;
+    done({ready: ok, installed: true, errors: s.errors.slice(), started: s.started, elapsed: Date.now() - begin});
+}
+function check() {
+    var s = ready.state, now = Date.now();
+    var idle = now - s.lastChange;
+    // 面板没有数据请求（例如文本面板）时，从面板挂载起等待 noRequestMs 后只看页面是否稳定；
+    // 仪表板 JSON 还没有加载完、面板没有挂载时不算完成
+    var requested = s.started > 0 || (ready.mounted() && now - s.mountedAt >= noRequestMs);
+    if (s.inflight === 0 && requested && idle >= quietMs) {
+        finish(true);
+    } else if (now - begin >= timeoutMs) {
+        finish(false);
+    } else {
+        schedule();
+    }
+}
+function schedule() {
+    clearTimeout(timer);
+    var s = ready.state, now = Date.now();
+    var wait = quietMs - (now - s.lastChange);
+    if (s.started === 0) {
+        // 没有挂载时页面变化会重新安排检查，这里只是兜底的定时检查
+        wait = Math.max(wait, ready.mounted() ? noRequestMs - (now - s.mountedAt) : noRequestMs);
+    }
+    wait = Math.min(Math.max(wait, 20), timeoutMs - (now - begin));
+    timer = setTimeout(check, Math.max(wait, 0));
+}
+ready.subscribe(schedule);
+schedule();
+"""
+
+# 通过 Grafana 前端路由切换 URL，不重新加载页面
+# Grafana 的 locationService 基于 history 库并监听 popstate，pushState 后手动触发一次 popstate 即可让路由生效
+NAVIGATE_SCRIPT = r"""
+var path = arguments[0], timeoutMs = arguments[1], done = arguments[arguments.length - 1];
+var ready = window.__panelReady;
+if (!ready) {
+    done(false);
+    return;
+}
+ready.reset();
+var timer = null;
+
+function check() {
+    // 路由生效后新面板会发出数据请求
+    if (ready.state.started > 0) {
+        clearTimeout(timer);
+        ready.unsubscribe(check);
+        done(true);
+    }
+}
+ready.subscribe(check);
+timer = setTimeout(function () {
+    ready.unsubscribe(check);
+    done(ready.state.started > 0);
+}, timeoutMs);
+
+window.history.pushState(window.history.state, '', path);
+window.dispatchEvent(new PopStateEvent('popstate', {state: window.history.state}));
+"""
+
+
+def install(driver):
+    """在之后打开的每个页面加载前注入检测脚本，需要在打开 Grafana 页面之前调用"""
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": READY_SCRIPT})
+
+
+def wait_for_panel_ready(driver, timeout=600, quiet_ms=500, no_request_ms=3000):
+    """
+    等待当前页面的面板加载完成
+
+    Args:
+        timeout: 最长等待时间（秒）
+        quiet_ms: 数据请求结束后页面保持不变的时间（毫秒），用于等待图表绘制
+        no_request_ms: 面板没有发出数据请求时，从面板挂载起的等待时间（毫秒）
+    Returns:
+        dict: {'ready': bool, 'installed': bool, 'errors': list, 'started': int, 'elapsed': int}
+    """
+    driver.set_script_timeout(timeout + 5)
+    try:
+        return driver.execute_async_script(WAIT_SCRIPT, quiet_ms, timeout * 1000, no_request_ms)
+    except Exception as e:
+        print(f"等待面板加载失败: {str(e)}")
+        return {'ready': False, 'installed': True, 'errors': [str(e)], 'started': 0}
+
+
+def navigate_in_app(driver, path, timeout_ms=3000):
+    """
+    在当前标签页内通过前端路由切换到 path（例如 /d/uid/?viewPanel=panel-2）
+    返回 False 表示路由没有响应，调用方需要退回到 driver.get
+    """
+    driver.set_script_timeout(timeout_ms / 1000 + 5)
+    try:
+        return bool(driver.execute_async_script(NAVIGATE_SCRIPT, path, timeout_ms))
+    except Exception as e:
+        print(f"页面内切换失败: {str(e)}")
+        return False
@@ -1,42 +1,708 @@
 from dotenv import load_dotenv
-import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from datetime import datetime, timedelta, timezone
+import grafana_template
+import query_cache
+import rollup_store
+import utils
+import threading
+import heapq
+import copy
+import codecs
+import json
 import os
+import re
 
 
 load_dotenv()
 
-def query_prometheus(expr, start, end):
+# 所有查询共用的 HTTP 会话，复用 keep-alive 连接
+_session = None
+_session_lock = threading.Lock()
+# 查询结果磁盘缓存，PROM_CACHE=False 时不使用
+_cache = None
+
+
+def get_session():
+    """获取共用的 requests.Session，连接池大小与最大并发数一致"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = utils.new_session(utils.get_env_int("PROM_CONCURRENCY", 8))
+        return _session
+
+
+def get_query_cache():
+    """获取共用的查询结果缓存，PROM_CACHE=False 时返回 None"""
+    global _cache
+    if os.getenv("PROM_CACHE", "True") == "False":
+        return None
+    with _session_lock:
+        if _cache is None:
+            _cache = query_cache.QueryCache()
+        return _cache
+
+
+def cached_query(key, closed, fetch):
     """
-    查询 prometheus 数据
+    先从查询缓存读取，没有时调用 fetch() 查询并缓存成功的结果
+    closed: 时间范围是否已经结束
+    """
+    cache = get_query_cache()
+    if cache is None:
+        return fetch()
+
+    data = cache.get(key)
+    if data is not None:
+        print(f"命中查询缓存: {key[2]}")
+        return data
+    data = fetch()
+    if isinstance(data, dict) and data.get('status') == 'success':
+        cache.put(key, data, closed)
+    return data
+
+
+# 候选 step（秒），计算出的 step 向上取整到其中一个，同一时间范围的查询使用相同的 step，便于查询缓存复用
+STEP_CHOICES = [15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400]
+
+
+def choose_step(start_dt, end_dt, interval=None, max_data_points=None):
+    """
+    按每条序列的采样点预算选择 step 参数
+      - 采样点数不超过 PROM_MAX_POINTS，面板设置了 maxDataPoints 时取两者中较小的一个
+      - step 不小于采集间隔 PROM_SCRAPE_INTERVAL 和面板的 interval（Grafana 面板的 Min interval）
+
+    Args:
+        interval: 面板的最小间隔，例如 "1m"、">1m"
+        max_data_points: 面板的 maxDataPoints
+    """
+    range_seconds = max((end_dt - start_dt).total_seconds(), 1)
+    max_points = utils.get_env_int("PROM_MAX_POINTS", 1000)
+    try:
+        if max_data_points:
+            max_points = min(max_points, int(max_data_points))
+    except (TypeError, ValueError):
+        print(f"maxDataPoints 配置错误: {max_data_points}")
+
+    step = max(range_seconds / max(max_points, 1),
+               parse_duration(os.getenv("PROM_SCRAPE_INTERVAL", "30s")),
+               parse_duration(str(interval).lstrip('>')) if interval else 0)
+    for choice in STEP_CHOICES:
+        if choice >= step:
+            return grafana_template.format_duration(choice)
+    return grafana_template.format_duration(-(-step // 86400) * 86400)
+
+
+def peak_expr(expr, stat, step):
+    """
+    step 大于采集间隔时，两个采样点之间的尖峰会被漏掉；
+    用 max_over_time/min_over_time 子查询按采集间隔计算每个 step 内的最大/最小值，传输的采样点数不变
+    max/min 出现的时间为所在 step 的结束时刻
+    """
+    resolution = os.getenv("PROM_SCRAPE_INTERVAL", "30s")
+    if parse_duration(step) <= parse_duration(resolution):
+        return expr
+    function = {'max': 'max_over_time', 'min': 'min_over_time'}[stat]
+    return f"{function}(({expr})[{step}:{resolution}])"
+
+
+def interpolate(expr, start_dt, end_dt, step):
+    """替换 $__range、$__interval、$__rate_interval 等与时间范围相关的内置变量"""
+    builtins = grafana_template.builtin_variables(
+        (end_dt - start_dt).total_seconds(), parse_duration(step), parse_duration(os.getenv("PROM_SCRAPE_INTERVAL", "30s"))
+    )
+    return grafana_template.render(expr, builtins)
+
+
+def parse_duration(duration):
+    """将 Prometheus 时长（如 30s、5m、1h、1d）转换为秒数"""
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'y': 31536000}
+    total = 0
+    for number, unit in re.findall(r'(\d+)(ms|[smhdwy])', duration):
+        total += int(number) * units[unit]
+    return total
+
+
+def align_start(start_dt, step_seconds):
+    """
+    将开始时间向前对齐到 step 的整数倍（与 Grafana 一致）
+    query_range 的采样点为 start + k*step，对齐后与下推计算中子查询的采样点（step 的整数倍时刻）相同
     """
+    epoch = int((start_dt - datetime(1970, 1, 1)).total_seconds())
+    step_seconds = int(step_seconds)
+    if step_seconds <= 0:
+        return start_dt
+    return start_dt - timedelta(seconds=epoch % step_seconds)
+
+
+def plan_shards(start_dt, end_dt, step_seconds, max_points=None, series=1, max_samples=None):
+    """
+    按预计采样点数拆分查询时间范围
+    每个分片的起点都落在 start + k*step 上，与不拆分时的采样时间一致；相邻分片共享边界上的一个采样点，合并时去重
+
+    max_points: 每个分片每条序列的最大采样点数，默认读取 PROM_SHARD_POINTS（Prometheus 单条序列上限为 11000），0 表示不拆分
+    series: 预计返回的序列数，见 estimate_series
+    max_samples: 每个分片所有序列的最大采样点数（序列数 × 采样点数），默认读取 PROM_SHARD_SAMPLES，0 表示不按总数拆分
+    return: [(start_dt, end_dt), ...]
+    """
+    max_points = max_points if max_points is not None else utils.get_env_int("PROM_SHARD_POINTS", 10000)
+    max_samples = max_samples if max_samples is not None else utils.get_env_int("PROM_SHARD_SAMPLES", 0)
+    total_seconds = (end_dt - start_dt).total_seconds()
+    points = int(total_seconds // step_seconds) + 1 if step_seconds > 0 else 1
+
+    count = 1
+    if max_points > 1 and points > max_points:
+        count = -(-(points - 1) // (max_points - 1))
+    if max_samples > 0 and series * points > max_samples:
+        count = max(count, -(-(series * points) // max_samples))
+    # 每个分片至少 2 个采样点
+    count = min(count, max(points // 2, 1))
+    if count <= 1:
+        return [(start_dt, end_dt)]
+
+    shard_seconds = -(-(points - 1) // count) * step_seconds
+    shards = []
+    offset = 0
+    while offset < total_seconds:
+        shard_end = min(offset + shard_seconds, total_seconds)
+        shards.append((start_dt + timedelta(seconds=offset), start_dt + timedelta(seconds=shard_end)))
+        offset += shard_seconds
+    return shards
+
+
+def estimate_series(expr, time):
+    """
+    用即时查询 count(expr) 估计查询返回的序列数，供 plan_shards 按总采样点数拆分
+    每个查询多一次请求，默认关闭：PROM_SHARD_SAMPLES=0（默认）或查询失败时返回 1
+    """
+    if utils.get_env_int("PROM_SHARD_SAMPLES", 0) <= 0:
+        return 1
+    try:
+        data = query_prometheus_instant(f"count({expr})", time)
+        return max(int(float(data['data']['result'][0]['value'][1])), 1)
+    except Exception:
+        return 1
+
+
+def merge_shards(responses):
+    """
+    按序列合并各分片的 query_range 结果，去掉分片边界上重复的采样点
+    任意分片失败时返回该分片的错误
+    """
+    series = {}
+    for data in responses:
+        if not isinstance(data, dict) or data.get('status') != 'success':
+            return data
+        for item in data.get('data', {}).get('result', []):
+            key = tuple(sorted(item.get('metric', {}).items()))
+            merged = series.setdefault(key, {'metric': item.get('metric', {}), 'values': {}})
+            for timestamp, value in item.get('values', []):
+                merged['values'].setdefault(timestamp, value)
+
+    result = [
+        {'metric': merged['metric'], 'values': [[timestamp, merged['values'][timestamp]] for timestamp in sorted(merged['values'])]}
+        for merged in series.values()
+    ]
+    return {'status': 'success', 'data': {'resultType': 'matrix', 'result': result}}
+
+
+def fetch_range(expr, start, end, step, timeout):
+    """执行一次 query_range 请求，结果经过查询缓存"""
     url = os.getenv('PROMETHEUS_URL') + '/api/v1/query_range'
+    params = {
+        'query': expr,
+        'start': start,
+        'end': end,
+        'step': step
+    }
+    key = (os.getenv('PROMETHEUS_URL'), 'query_range', expr, start, end, step)
+    return cached_query(key, utils.is_closed_window(start, end),
+                        lambda: get_session().get(url, params=params, timeout=timeout).json())
 
+
+def prepare_range_query(expr, start, end, interval=None, max_data_points=None, peak=None, step=None):
+    """
+    确定 query_range 的 step、替换变量后的查询语句和分片，开始时间向前对齐到 step 的整数倍（见 align_start）
+    peak: 'max' 或 'min' 时改写为保留尖峰的子查询，见 peak_expr
+    step: 指定 step（例如 "2m"）时不再按时间范围选择
+    return: (expr, step, [(start, end), ...])
+    """
     end_dt = datetime.strptime(end, '%Y-%m-%dT%H:%M:%SZ')
     start_dt = datetime.strptime(start, '%Y-%m-%dT%H:%M:%SZ')
+    step = step or choose_step(start_dt, end_dt, interval, max_data_points)
+    expr = interpolate(expr, start_dt, end_dt, step)
+    if peak:
+        expr = peak_expr(expr, peak, step)
 
-    # 根据查询时间范围调整 step 参数
-    if (end_dt - start_dt).days > 15:
-        step = '6h'
-    elif (end_dt - start_dt).days > 5:
-        step = '1h'
-    else:
-        step = '5m'
+    print(f"查询 Prometheus: {expr}, 开始时间: {start}, 结束时间: {end}, 查询时间范围: {end_dt - start_dt}, step: {step}, 设置 step 参数: {step}")
 
-    # 根据时间范围替换range变量
-    if '$__range' in expr:
-        expr = expr.replace('$__range', f'{(end_dt - start_dt).days}d')
+    shards = plan_shards(align_start(start_dt, parse_duration(step)), end_dt, parse_duration(step), series=estimate_series(expr, end))
+    if len(shards) > 1:
+        print(f"查询时间范围拆分为 {len(shards)} 个分片: {expr}")
+    ranges = [(a.strftime('%Y-%m-%dT%H:%M:%SZ'), b.strftime('%Y-%m-%dT%H:%M:%SZ')) for a, b in shards]
+    return expr, step, ranges
 
-    print(f"查询 Prometheus: {expr}, 开始时间: {start}, 结束时间: {end}, 查询时间范围: {end_dt - start_dt}, step: {step}, 设置 step 参数: {step}")
 
+def query_prometheus(expr, start, end, timeout=None, interval=None, max_data_points=None, peak=None, step=None):
+    """
+    查询 prometheus 数据
+    timeout: 单个查询的超时时间（秒），默认读取 PROM_TIMEOUT
+    interval, max_data_points, peak, step: 见 prepare_range_query
+
+    每条序列的采样点数超过 PROM_SHARD_POINTS，或序列数 × 采样点数超过 PROM_SHARD_SAMPLES 时，
+    按时间拆分为多个分片并发查询，再按序列合并
+    """
+    timeout = timeout or utils.get_env_int("PROM_TIMEOUT", 60)
+    expr, step, ranges = prepare_range_query(expr, start, end, interval, max_data_points, peak, step)
+    if len(ranges) == 1:
+        return fetch_range(expr, ranges[0][0], ranges[0][1], step, timeout)
+
+    concurrency = utils.get_env_int("PROM_SHARD_CONCURRENCY", 4)
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(ranges))) as executor:
+        responses = list(executor.map(lambda r: fetch_range(expr, r[0], r[1], step, timeout), ranges))
+    return merge_shards(responses)
+
+
+def stream_series(chunks, on_series):
+    """
+    增量解析 query_range 响应，每解析出 data.result 中的一条序列就调用一次 on_series(item)
+    内存中只保留当前正在解析的序列，不会构造完整的响应
+
+    Args:
+        chunks: 响应体的字节块迭代器，例如 response.iter_content()
+    Returns:
+        dict: 不含 result 的响应状态，例如 {'status': 'success'}；失败时为 Prometheus 返回的错误 JSON
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    exhausted = False
+
+    def more():
+        nonlocal buffer, exhausted
+        try:
+            buffer += text_decoder.decode(next(chunks))
+        except StopIteration:
+            buffer += text_decoder.decode(b'', final=True)
+            exhausted = True
+
+    def incomplete():
+        return {'status': 'error', 'errorType': 'client', 'error': 'Prometheus 响应不完整'}
+
+    # Prometheus 按 status、data.resultType、data.result 的顺序输出，先找到 result 数组的开头
+    while True:
+        match = re.search(r'"result"\s*:\s*\[', buffer)
+        if match:
+            break
+        if exhausted:
+            # 错误响应没有 result
+            try:
+                return json.loads(buffer)
+            except ValueError:
+                return incomplete()
+        more()
+    status = re.search(r'"status"\s*:\s*"(\w+)"', buffer[:match.start()])
+    pos = match.end()
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buffer):
+            if exhausted:
+                return incomplete()
+            more()
+            continue
+        if buffer[pos] == ']':
+            break
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # 当前序列还没有完整接收
+            if exhausted:
+                return incomplete()
+            more()
+            continue
+        on_series(item)
+        buffer = buffer[end:]
+        pos = 0
+
+    return {'status': status.group(1) if status else 'success'}
+
+
+def stream_range(expr, start, end, step, timeout, aggregator):
+    """执行一次 query_range 请求，边接收边把序列交给 aggregator，不经过查询缓存"""
+    url = os.getenv('PROMETHEUS_URL') + '/api/v1/query_range'
     params = {
         'query': expr,
         'start': start,
         'end': end,
         'step': step
     }
-    response = requests.get(url, params=params)
-    return response.json()
+    with get_session().get(url, params=params, timeout=timeout, stream=True) as response:
+        return stream_series(
+            response.iter_content(chunk_size=65536),
+            lambda item: aggregator.add_series(item.get('metric', {}), *parse_series(item.get('values', [])))
+        )
+
+
+def query_prometheus_stream(expr, start, end, aggregator, timeout=None, interval=None, max_data_points=None, peak=None, step=None):
+    """
+    流式查询 prometheus 数据，样本直接加入 aggregator，峰值内存与响应大小无关
+    已缓存的分片直接从查询缓存读取；流式查询的结果不写入缓存
+
+    return: 查询状态，所有分片成功时为 {'status': 'success'}，否则为失败分片的错误（不再查询后面的分片）
+    """
+    timeout = timeout or utils.get_env_int("PROM_TIMEOUT", 60)
+    expr, step, ranges = prepare_range_query(expr, start, end, interval, max_data_points, peak, step)
+    step_seconds = parse_duration(step)
+    cache = get_query_cache()
+
+    for index, (shard_start, shard_end) in enumerate(ranges):
+        if cache is not None:
+            data = cache.get((os.getenv('PROMETHEUS_URL'), 'query_range', expr, shard_start, shard_end, step))
+            if data is not None:
+                print(f"命中查询缓存: {expr}")
+                # 相邻分片共享边界采样点，后面的分片跳过第一个采样点，避免重复计入 sum/count
+                if index > 0:
+                    boundary = datetime.strptime(shard_start, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+                    data = {'data': {'result': [
+                        dict(item, values=[v for v in item.get('values', []) if float(v[0]) > boundary])
+                        for item in data['data']['result']
+                    ]}}
+                aggregator.add_result(data)
+                continue
+
+        if index > 0:
+            shard_start = (datetime.strptime(shard_start, '%Y-%m-%dT%H:%M:%SZ') + timedelta(seconds=step_seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        status = stream_range(expr, shard_start, shard_end, step, timeout, aggregator)
+        if status.get('status') != 'success':
+            print(f"流式查询 Prometheus 失败: {expr}, 错误: {status.get('error')}")
+            return status
+    return {'status': 'success'}
+
+
+def query_prometheus_instant(expr, time, timeout=None):
+    """在 time 时刻执行即时查询（/api/v1/query）"""
+    url = os.getenv('PROMETHEUS_URL') + '/api/v1/query'
+    print(f"即时查询 Prometheus: {expr}, 时间: {time}")
+    timeout = timeout or utils.get_env_int("PROM_TIMEOUT", 60)
+    key = (os.getenv('PROMETHEUS_URL'), 'query', expr, time)
+    return cached_query(key, utils.is_closed_window(time, time),
+                        lambda: get_session().get(url, params={'query': expr, 'time': time}, timeout=timeout).json())
+
+
+def run_batch(func, items, concurrency=None):
+    """使用线程池并发执行 func(item)，返回与 items 顺序一致的结果"""
+    concurrency = concurrency or utils.get_env_int("PROM_CONCURRENCY", 8)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+def parse_stat(stat):
+    """
+    解析统计项名称，支持 max、min、avg、sum、count、last、百分位数 p50、p95、p99.9 等，
+    以及峰值最高/最低的 K 条序列 top5、bottom5 等
+    return: (类型, 参数)，参数为百分位数或 K，不支持的统计项返回 (None, None)
+    """
+    if stat in ('max', 'min', 'avg', 'sum', 'count', 'last'):
+        return stat, None
+    if isinstance(stat, str) and re.fullmatch(r'(top|bottom)[1-9]\d*', stat):
+        kind = 'top' if stat.startswith('top') else 'bottom'
+        return kind, int(stat[len(kind):])
+    if isinstance(stat, str) and re.fullmatch(r'p\d+(\.\d+)?', stat):
+        q = float(stat[1:])
+        if 0 <= q <= 100:
+            return 'percentile', q
+    return None, None
+
+
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SeriesMatrix:
+    """
+    query_range 结果的列式表示
+    所有序列的时间戳和值分别拼接成一个 float64 数组，series 记录每个样本所属序列在 labels 表中的下标
+    """
+    def __init__(self, labels, timestamps, values, series):
+        self.labels = labels
+        self.timestamps = timestamps
+        self.values = values
+        self.series = series
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+def parse_series(item_values):
+    """将 [[timestamp, "value"], ...] 转换为时间戳数组和值数组，"NaN"、"+Inf" 由 numpy 直接解析"""
+    try:
+        pairs = np.array(item_values, dtype=object).reshape(-1, 2)
+        return pairs[:, 0].astype(np.float64), pairs[:, 1].astype(np.float64)
+    except (ValueError, TypeError):
+        pass
+
+    # 存在格式错误的样本时逐个解析，跳过错误样本
+    timestamps, values = [], []
+    for value in item_values:
+        if not isinstance(value, list) or len(value) < 2:
+            continue
+        try:
+            timestamp, current_value = float(value[0]), float(value[1])
+        except (ValueError, TypeError) as e:
+            print(f"错误：解析值或时间戳失败 - {e}")
+            continue
+        timestamps.append(timestamp)
+        values.append(current_value)
+    return np.array(timestamps, dtype=np.float64), np.array(values, dtype=np.float64)
+
+
+def to_columnar(data):
+    """
+    将 Prometheus API 返回的 JSON 转换为 SeriesMatrix
+
+    Returns:
+        SeriesMatrix，数据结构不符合预期时返回 None
+    """
+    # 数据验证
+    if not isinstance(data, dict):
+        print("错误：数据不是字典类型")
+        return None
+
+    if 'data' not in data or 'result' not in data['data']:
+        print("错误：数据结构不符合预期")
+        return None
+
+    labels, timestamps, values, series = [], [], [], []
+    for index, item in enumerate(data['data']['result']):
+        # 获取metric信息和标签
+        labels.append(item.get('metric', {}))
+        item_timestamps, item_values = parse_series(item.get('values', []))
+        timestamps.append(item_timestamps)
+        values.append(item_values)
+        series.append(np.full(len(item_values), index, dtype=np.int32))
+
+    if not labels:
+        empty = np.array([], dtype=np.float64)
+        return SeriesMatrix(labels, empty, empty, np.array([], dtype=np.int32))
+    return SeriesMatrix(labels, np.concatenate(timestamps), np.concatenate(values), np.concatenate(series))
+
+
+class TopK:
+    """
+    有界堆，保留峰值最高（largest=True）或最低的 k 条序列，内存为 O(k)
+    同一条序列分多次加入（分片、流式解析）时只保留它的最大（最小）值
+    """
+    def __init__(self, k, largest=True):
+        self.k = k
+        self.largest = largest
+        # 小顶堆，元素为 [score, 序号, 序列键, (值, 标签, 时间戳)]，堆顶是当前第 k 名
+        self.heap = []
+        self.entries = {}
+        self.seq = 0
+
+
+    def threshold(self):
+        """进入前 k 名需要超过的分数，堆未满时为 None"""
+        return self.heap[0][0] if len(self.heap) >= self.k else None
+
+
+    def add(self, labels, point):
+        score = point[0] if self.largest else -point[0]
+        key = tuple(sorted(labels.items()))
+        entry = self.entries.get(key)
+        if entry is not None:
+            if score > entry[0]:
+                entry[0], entry[3] = score, point
+                heapq.heapify(self.heap)
+            return
+        if len(self.heap) >= self.k and score <= self.heap[0][0]:
+            return
+
+        self.seq += 1
+        entry = [score, self.seq, key, point]
+        self.entries[key] = entry
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        else:
+            removed = heapq.heapreplace(self.heap, entry)
+            del self.entries[removed[2]]
+
+
+    def points(self):
+        """按峰值从高到低（bottom 为从低到高）排列的 (值, 标签, 时间戳)"""
+        return [entry[3] for entry in sorted(self.heap, key=lambda entry: (-entry[0], entry[1]))]
+
+
+class Aggregator:
+    """
+    一次遍历 query_range 结果，同时计算多个统计项，计算过程在 numpy 数组上向量化完成
+    max/min/last 记录对应的标签和时间戳，百分位数需要保留全部样本值
+    """
+    def __init__(self, stats):
+        self.stats = []
+        for stat in stats:
+            kind, q = parse_stat(stat)
+            if kind is None:
+                print(f"错误：不支持的统计项 {stat}")
+                continue
+            self.stats.append((stat, kind, q))
+
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self.min = None
+        self.last = None
+        self.need_values = any(kind == 'percentile' for stat, kind, q in self.stats)
+        self.values = []
+        self.top = {stat: TopK(q, largest=(kind == 'top')) for stat, kind, q in self.stats if kind in ('top', 'bottom')}
+
+
+    def add_series(self, labels, timestamps, values):
+        """加入一个序列的时间戳数组和值数组"""
+        self.add_matrix(SeriesMatrix([labels], timestamps, values, np.zeros(len(values), dtype=np.int32)))
+
+
+    def add_matrix(self, matrix):
+        """加入一个 SeriesMatrix，NaN 值跳过"""
+        mask = ~np.isnan(matrix.values)
+        values = matrix.values[mask]
+        if values.size == 0:
+            return
+        timestamps = matrix.timestamps[mask]
+        series = matrix.series[mask]
+
+        def point(index):
+            return (float(values[index]), matrix.labels[series[index]], float(timestamps[index]))
+
+        self.count += int(values.size)
+        self.total += float(values.sum())
+
+        # argmax/argmin 返回第一次出现的位置，与逐个样本比较的结果一致
+        index = int(np.argmax(values))
+        if self.max is None or values[index] > self.max[0]:
+            self.max = point(index)
+        index = int(np.argmin(values))
+        if self.min is None or values[index] < self.min[0]:
+            self.min = point(index)
+        index = int(np.argmax(timestamps))
+        if self.last is None or timestamps[index] > self.last[2]:
+            self.last = point(index)
+        if self.need_values:
+            self.values.append(values)
+        if self.top:
+            self._add_top(values, timestamps, series, matrix.labels)
+
+
+    def _add_top(self, values, timestamps, series, labels):
+        """按序列计算峰值并加入各个 TopK，每个序列的样本在数组中是连续的"""
+        starts = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+        ends = np.r_[starts[1:], len(values)]
+        peaks = {True: np.maximum.reduceat(values, starts), False: np.minimum.reduceat(values, starts)}
+
+        for top in self.top.values():
+            scores = peaks[True] if top.largest else -peaks[False]
+            # 只有本次峰值排在前 k 名的序列才可能进入 TopK
+            candidates = np.arange(len(starts))
+            if len(candidates) > top.k:
+                candidates = np.argpartition(-scores, top.k - 1)[:top.k]
+            threshold = top.threshold()
+            for i in candidates:
+                if threshold is not None and scores[i] <= threshold and tuple(sorted(labels[series[starts[i]]].items())) not in top.entries:
+                    continue
+                segment = values[starts[i]:ends[i]]
+                index = starts[i] + int(np.argmax(segment) if top.largest else np.argmin(segment))
+                top.add(labels[series[index]], (float(values[index]), labels[series[index]], float(timestamps[index])))
+
+
+    def add_result(self, data):
+        """加入一个 Prometheus API 返回的完整 JSON，数据结构不符合预期时返回 False"""
+        matrix = to_columnar(data)
+        if matrix is None:
+            return False
+        self.add_matrix(matrix)
+        return True
+
+
+    def state(self):
+        """可以合并的中间结果，用于保存日汇总（不包含百分位数需要的样本值）"""
+        return {'count': self.count, 'total': self.total, 'max': self.max, 'min': self.min, 'last': self.last}
+
+
+    def add_state(self, state):
+        """合并另一个 Aggregator.state() 的结果"""
+        self.count += state['count']
+        self.total += state['total']
+        if state['max'] is not None and (self.max is None or state['max'][0] > self.max[0]):
+            self.max = tuple(state['max'])
+        if state['min'] is not None and (self.min is None or state['min'][0] < self.min[0]):
+            self.min = tuple(state['min'])
+        if state['last'] is not None and (self.last is None or state['last'][2] > self.last[2]):
+            self.last = tuple(state['last'])
+
+
+    def _point(self, point):
+        """max/min/last 的结果格式"""
+        if point is None:
+            return {'value': None, 'labels': None, 'timestamp': None, 'timestamp_formatted': None}
+        return {'value': point[0], 'labels': point[1], 'timestamp': point[2], 'timestamp_formatted': format_timestamp(point[2])}
+
+
+    def _percentile(self, q):
+        """线性插值计算百分位数"""
+        if not self.values:
+            return None
+        return float(np.percentile(np.concatenate(self.values), q))
+
+
+    def result(self):
+        """
+        Returns:
+            dict: {统计项: 结果}，max/min/last 的结果包含 value、labels、timestamp、timestamp_formatted，
+                  avg/sum/百分位数的结果包含 value 和 total_samples，count 的结果包含 value，
+                  top/bottom 的结果包含 value（第一名的值）和 items（每条序列的结果，格式与 max 相同）
+        """
+        results = {}
+        for stat, kind, q in self.stats:
+            if kind == 'max':
+                results[stat] = self._point(self.max)
+            elif kind == 'min':
+                results[stat] = self._point(self.min)
+            elif kind == 'last':
+                results[stat] = self._point(self.last)
+            elif kind == 'avg':
+                results[stat] = {'value': self.total / self.count if self.count else None, 'total_samples': self.count}
+            elif kind == 'sum':
+                results[stat] = {'value': self.total if self.count else None, 'total_samples': self.count}
+            elif kind == 'count':
+                results[stat] = {'value': self.count}
+            elif kind == 'percentile':
+                results[stat] = {'value': self._percentile(q), 'total_samples': self.count}
+            elif kind in ('top', 'bottom'):
+                items = [self._point(point) for point in self.top[stat].points()]
+                results[stat] = {'value': items[0]['value'] if items else None, 'items': items}
+        return results
+
+
+def aggregate(data, stats):
+    """
+    只遍历一次 prometheus 数据，计算 stats 中的所有统计项
+
+    Args:
+        data: Prometheus API返回的JSON数据
+        stats: 统计项列表，例如 ['max', 'min', 'avg', 'p95']
+    Returns:
+        dict: {统计项: 结果}，格式见 Aggregator.result
+    """
+    aggregator = Aggregator(stats)
+    aggregator.add_result(data)
+    return aggregator.result()
 
 
 def get_max_value_with_labels(data):
@@ -55,65 +721,7 @@ def get_max_value_with_labels(data):
                 'timestamp_formatted': str, # 格式化的时间戳
             }
     """
-    # 初始化结果
-    result = {
-        'value': None,
-        'labels': None,
-        'timestamp': None,
-        'timestamp_formatted': None
-    }
-    
-    # 数据验证
-    if not isinstance(data, dict):
-        print("错误：数据不是字典类型")
-        return result
-        
-    if 'data' not in data or 'result' not in data['data']:
-        print("错误：数据结构不符合预期")
-        return result
-    
-    max_value = float('-inf')
-    max_value_info = None
-    
-    # 遍历所有查询结果
-    for item in data['data']['result']:
-        # 获取metric信息和标签
-        labels = item.get('metric', {})
-        
-        # 遍历时间序列数据
-        for value in item.get('values', []):
-            if not isinstance(value, list) or len(value) < 2:
-                continue
-                
-            try:
-                # 转换值和时间戳
-                current_value = float(value[1])
-                timestamp = float(value[0])
-                
-                # 跳过NaN值
-                if current_value != current_value:
-                    continue
-                    
-                # 更新最大值信息
-                if current_value > max_value:
-                    max_value = current_value
-                    max_value_info = {
-                        'value': current_value,
-                        'labels': labels,
-                        'timestamp': timestamp
-                    }
-                    
-            except (ValueError, TypeError) as e:
-                print(f"错误：解析值或时间戳失败 - {e}")
-                continue
-    
-    # 如果找到最大值，更新结果
-    if max_value_info:
-        result.update(max_value_info)
-        # 格式化输出
-        result['timestamp_formatted'] = datetime.fromtimestamp(result['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-    
-    return result
+    return aggregate(data, ['max'])['max']
 
 
 def get_min_value_with_labels(data):
@@ -132,65 +740,7 @@ def get_min_value_with_labels(data):
                 'timestamp_formatted': str, # 格式化的时间戳
             }
     """
-    # 初始化结果
-    result = {
-        'value': None,
-        'labels': None,
-        'timestamp': None,
-        'timestamp_formatted': None
-    }
-    
-    # 数据验证
-    if not isinstance(data, dict):
-        print("错误：数据不是字典类型")
-        return result
-        
-    if 'data' not in data or 'result' not in data['data']:
-        print("错误：数据结构不符合预期")
-        return result
-    
-    min_value = float('inf')
-    min_value_info = None
-    
-    # 遍历所有查询结果
-    for item in data['data']['result']:
-        # 获取metric信息和标签
-        labels = item.get('metric', {})
-        
-        # 遍历时间序列数据
-        for value in item.get('values', []):
-            if not isinstance(value, list) or len(value) < 2:
-                continue
-                
-            try:
-                # 转换值和时间戳
-                current_value = float(value[1])
-                timestamp = float(value[0])
-                
-                # 跳过NaN值
-                if current_value != current_value:
-                    continue
-                    
-                # 更新最小值信息
-                if current_value < min_value:
-                    min_value = current_value
-                    min_value_info = {
-                        'value': current_value,
-                        'labels': labels,
-                        'timestamp': timestamp
-                    }
-                    
-            except (ValueError, TypeError) as e:
-                print(f"错误：解析值或时间戳失败 - {e}")
-                continue
-    
-    # 如果找到最小值，更新结果
-    if min_value_info:
-        result.update(min_value_info)
-        # 格式化输出
-        result['timestamp_formatted'] = datetime.fromtimestamp(result['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-    
-    return result
+    return aggregate(data, ['min'])['min']
 
 
 def get_avg_value_with_labels(data):
@@ -205,58 +755,292 @@ def get_avg_value_with_labels(data):
             {
                 'value': float,        # 平均值
                 'total_samples': int,      # 有效样本数量
-                'labels': list            # 所有labels信息
             }
     """
-    # 初始化结果
-    result = {
-        'value': None,
-        'total_samples': 0
+    return aggregate(data, ['avg'])['avg']
+
+
+# 可以下推到 Prometheus 计算的统计项
+PUSHDOWN_STATS = ('max', 'min', 'avg', 'sum', 'count')
+
+
+def build_pushdown_queries(expr, start_dt, end_dt, step):
+    """
+    将面板表达式改写为只返回聚合结果的即时查询
+    子查询 [range:step] 的采样点是 step 的整数倍时刻，start_dt 需要先按 align_start 对齐，
+    这样与 query_range 的采样点相同；range 多 1 秒以包含起始时刻的采样点
+    max/min 使用 topk/bottomk 保留对应序列的标签
+    """
+    subquery = f"({expr})[{int((end_dt - start_dt).total_seconds()) + 1}s:{step}]"
+    return {
+        'max': f"topk(1, max_over_time({subquery}))",
+        'min': f"bottomk(1, min_over_time({subquery}))",
+        'sum': f"sum(sum_over_time({subquery}))",
+        'count': f"sum(count_over_time({subquery}))",
     }
-    
-    # 数据验证
-    if not isinstance(data, dict):
-        print("错误：数据不是字典类型")
-        return result
-        
-    if 'data' not in data or 'result' not in data['data']:
-        print("错误：数据结构不符合预期")
-        return result
-    
-    total_value = 0.0
-    sample_count = 0
-    
-    # 遍历所有查询结果
-    for item in data['data']['result']:
 
-        # 遍历时间序列数据
-        for value in item.get('values', []):
-            if not isinstance(value, list) or len(value) < 2:
-                continue
-                
-            try:
-                # 转换值
-                current_value = float(value[1])
-                
-                # 跳过NaN值
-                if current_value != current_value:
-                    continue
-                    
-                # 累加值和计数
-                total_value += current_value
-                sample_count += 1
-                    
-            except (ValueError, TypeError) as e:
-                print(f"错误：解析值或时间戳失败 - {e}")
-                continue
-    
-    # 如果有有效样本，计算平均值
-    if sample_count > 0:
-        avg_value = total_value / sample_count
-        result['value'] = avg_value
-        result['total_samples'] = sample_count
-    
-    return result
+
+def query_pushdown(expr, start, end, stats, interval=None, max_data_points=None):
+    """
+    在 Prometheus 端完成聚合，只返回聚合后的几个样本
+    max/min 的结果中 timestamp 为 None（即时查询无法得到极值出现的时刻），其他字段与 aggregate 一致
+
+    Returns:
+        dict: {统计项: 结果}，只包含 PUSHDOWN_STATS 中的统计项
+    """
+    end_dt = datetime.strptime(end, '%Y-%m-%dT%H:%M:%SZ')
+    start_dt = datetime.strptime(start, '%Y-%m-%dT%H:%M:%SZ')
+    step = choose_step(start_dt, end_dt, interval, max_data_points)
+    queries = build_pushdown_queries(interpolate(expr, start_dt, end_dt, step), align_start(start_dt, parse_duration(step)), end_dt, step)
+
+    def instant(name):
+        data = query_prometheus_instant(queries[name], end)
+        result = data.get('data', {}).get('result', []) if isinstance(data, dict) else []
+        if not result:
+            return None, None
+        # topk/bottomk 出现相同值时可能返回多个序列，取第一个
+        try:
+            return float(result[0]['value'][1]), result[0].get('metric', {})
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            print(f"错误：解析即时查询结果失败 - {e}")
+            return None, None
+
+    results = {}
+    for stat in stats:
+        if stat in ('max', 'min'):
+            value, labels = instant(stat)
+            results[stat] = {'value': value, 'labels': labels, 'timestamp': None, 'timestamp_formatted': None}
+
+    if any(stat in ('avg', 'sum', 'count') for stat in stats):
+        total, _ = instant('sum')
+        count, _ = instant('count')
+        count = int(count) if count else 0
+        if 'avg' in stats:
+            results['avg'] = {'value': total / count if count and total is not None else None, 'total_samples': count}
+        if 'sum' in stats:
+            results['sum'] = {'value': total if count else None, 'total_samples': count}
+        if 'count' in stats:
+            results['count'] = {'value': count}
+
+    return results
+
+
+def compare_with_client(pushed, client, tolerance=1e-6):
+    """
+    比较下推计算与客户端计算的结果
+    return: 不一致的统计项列表 [(统计项, 下推结果, 客户端结果)]
+    """
+    mismatches = []
+    for stat, result in pushed.items():
+        a, b = result['value'], client.get(stat, {}).get('value')
+        if a is None or b is None:
+            if a is not b:
+                mismatches.append((stat, a, b))
+        elif abs(a - b) > tolerance * max(1.0, abs(a), abs(b)):
+            mismatches.append((stat, a, b))
+    return mismatches
+
+
+def query_into(aggregator, expr, start, end, interval=None, max_data_points=None, peak=None, step=None):
+    """
+    下载 query_range 数据加入 aggregator，PROM_STREAM=True 时流式解析
+    return: 查询是否成功
+    """
+    if os.getenv("PROM_STREAM", "False") == "True":
+        status = query_prometheus_stream(expr, start, end, aggregator, interval=interval, max_data_points=max_data_points, peak=peak, step=step)
+        return status.get('status') == 'success'
+    data = query_prometheus(expr, start, end, interval=interval, max_data_points=max_data_points, peak=peak, step=step)
+    return isinstance(data, dict) and data.get('status') == 'success' and aggregator.add_result(data)
+
+
+# 可以由日汇总合并得到的统计项
+ROLLUP_STATS = ('max', 'min', 'avg', 'sum', 'count', 'last')
+# 取值随时间范围或 step 变化的内置变量，按天查询时会被替换为一天的值
+RANGE_VARIABLES = {'__range', '__range_s', '__range_ms', '__interval', '__interval_ms', '__rate_interval'}
+
+
+def split_days(start, end):
+    """
+    将时间范围拆分为 [开头不足一天的部分, 完整且已经结束的 UTC 自然日..., 结尾部分]
+    每段的结束时间比下一段的开始时间早 1 秒，query_range 不会在两段中重复计入同一个采样点
+
+    return: [(start, end, day), ...]，day 为完整自然日的日期（YYYY-MM-DD），其他部分为 None
+    """
+    fmt = '%Y-%m-%dT%H:%M:%SZ'
+    start_dt = datetime.strptime(start, fmt)
+    end_dt = datetime.strptime(end, fmt)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    pieces = []
+    cursor = start_dt
+    day = start_dt.replace(hour=0, minute=0, second=0)
+    if day < start_dt:
+        day += timedelta(days=1)
+    while day + timedelta(days=1) <= min(end_dt, now):
+        if cursor < day:
+            pieces.append((cursor, day - timedelta(seconds=1), None))
+        pieces.append((day, day + timedelta(days=1) - timedelta(seconds=1), day.strftime('%Y-%m-%d')))
+        cursor = day = day + timedelta(days=1)
+    if cursor <= end_dt:
+        pieces.append((cursor, end_dt, None))
+    return [(a.strftime(fmt), b.strftime(fmt), day) for a, b, day in pieces]
+
+
+def query_rollup(expr, start, end, stats, interval=None, max_data_points=None, peak=None):
+    """
+    按天查询并合并，完整的自然日从日汇总数据库（rollup_store.RollupStore）读取，只查询缺少的日期和不足一天的部分
+    所有分段使用同一个 step（按一天的时间范围选择，能整除一天），各段的样本密度相同，count/sum/avg 才能直接相加，
+    日汇总也不会随报告时间范围的长短变化；expr 不能引用 RANGE_VARIABLES 中的内置变量
+    """
+    day_start = datetime(2000, 1, 1)
+    step = choose_step(day_start, day_start + timedelta(days=1), interval, max_data_points)
+    store = rollup_store.RollupStore()
+    key = store.make_key(os.getenv('PROMETHEUS_URL'), expr, peak, step)
+    pieces = split_days(start, end)
+    stored = store.get(key, [day for piece_start, piece_end, day in pieces if day])
+    print(f"日汇总命中 {len(stored)} 天，需要查询 {len(pieces) - len(stored)} 段: {expr}")
+
+    aggregator = Aggregator(stats)
+    for piece_start, piece_end, day in pieces:
+        if day in stored:
+            aggregator.add_state(stored[day])
+            continue
+        piece = Aggregator(stats)
+        if not query_into(piece, expr, piece_start, piece_end, interval, max_data_points, peak, step):
+            # 任意一段失败时不使用不完整的统计结果
+            return Aggregator(stats).result()
+        if day:
+            store.put(key, day, piece.state())
+        aggregator.add_state(piece.state())
+    return aggregator.result()
+
+
+def query_client(expr, start, end, stats, interval=None, max_data_points=None, peak=None):
+    """
+    下载 query_range 数据并在本地计算 stats 中的统计项
+    PROM_ROLLUP=True 且统计项都可以由日汇总合并时，使用 query_rollup；
+    查询语句引用 $__range、$__interval 等内置变量时，按天查询的结果与整段查询不同，不使用日汇总
+    """
+    if (os.getenv("PROM_ROLLUP", "False") == "True" and all(stat in ROLLUP_STATS for stat in stats)
+            and not grafana_template.compile_template(expr).names & RANGE_VARIABLES):
+        return query_rollup(expr, start, end, stats, interval, max_data_points, peak)
+    aggregator = Aggregator(stats)
+    if not query_into(aggregator, expr, start, end, interval, max_data_points, peak):
+        return Aggregator(stats).result()
+    return aggregator.result()
+
+
+def query_stats(expr, start, end, stats, interval=None, max_data_points=None):
+    """
+    查询一个表达式并计算 stats 中的统计项
+
+    PROM_PUSHDOWN=True 时 PUSHDOWN_STATS 中的统计项在 Prometheus 端计算，其余统计项（last、百分位数）仍然下载完整数据计算；
+    PROM_PUSHDOWN_VERIFY=True 时同时按原方式计算并打印不一致的统计项；
+    PROM_PEAK_SUBQUERY=True 时 max/min 使用保留尖峰的子查询单独查询（见 peak_expr）
+    interval, max_data_points: 面板的最小间隔和 maxDataPoints，用于选择 step
+    """
+    results = {}
+    remaining = list(stats)
+    pushdown = os.getenv("PROM_PUSHDOWN", "False") == "True"
+    verify = os.getenv("PROM_PUSHDOWN_VERIFY", "False") == "True"
+    peak = os.getenv("PROM_PEAK_SUBQUERY", "False") == "True"
+
+    try:
+        if pushdown:
+            results.update(query_pushdown(expr, start, end, [stat for stat in stats if stat in PUSHDOWN_STATS], interval, max_data_points))
+            remaining = [stat for stat in stats if stat not in results]
+
+        if remaining or (pushdown and verify):
+            client_stats = stats if pushdown and verify else remaining
+            client = {}
+            if peak:
+                for stat in client_stats:
+                    kind = parse_stat(stat)[0]
+                    if kind in ('max', 'min', 'top', 'bottom'):
+                        client.update(query_client(expr, start, end, [stat], interval, max_data_points,
+                                                   peak='max' if kind in ('max', 'top') else 'min'))
+            plain_stats = [stat for stat in client_stats if stat not in client]
+            if plain_stats:
+                client.update(query_client(expr, start, end, plain_stats, interval, max_data_points))
+            if pushdown and verify:
+                for stat, pushed_value, client_value in compare_with_client(results, client):
+                    print(f"下推计算结果不一致: {expr}, {stat}: 下推 {pushed_value}, 客户端 {client_value}")
+            results.update({stat: client[stat] for stat in remaining})
+    except Exception as e:
+        print(f"查询 Prometheus 失败: {expr}, 错误: {str(e)}")
+
+    # 查询失败的统计项返回空结果，格式与 aggregate 一致
+    empty = Aggregator([stat for stat in stats if stat not in results]).result()
+    results.update(empty)
+    return results
+
+
+# 字符串字面量，规范化查询语句时保持原样
+STRING_LITERAL = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|`[^`]*`)')
+
+
+def normalize_expr(expr):
+    """
+    规范化查询语句，用于识别不同面板中相同的查询
+    去掉字符串以外的 # 注释，连续空白合并为一个空格，去掉括号、逗号和运算符两侧的空白
+    """
+    parts = STRING_LITERAL.split(expr.strip())
+    for i in range(0, len(parts), 2):
+        code = re.sub(r'\s+', ' ', re.sub(r'#[^\n]*', '', parts[i]))
+        parts[i] = re.sub(r' ?([{}()\[\],=~!<>+\-*/^%]) ?', r'\1', code)
+    return ''.join(parts)
+
+
+def plan_queries(items, start, end):
+    """
+    合并相同的查询：规范化后的查询语句和 step 都相同的请求只查询一次，统计项取并集
+    规范化的语句只用于分组，查询时使用组内第一个请求的原始语句（规范化会把 # 注释后面的行连到注释里）
+
+    Returns:
+        list: [{'expr': ..., 'stats': [...], 'interval': ..., 'max_data_points': ..., 'members': [items 中的下标, ...]}, ...]
+    """
+    start_dt = datetime.strptime(start, '%Y-%m-%dT%H:%M:%SZ')
+    end_dt = datetime.strptime(end, '%Y-%m-%dT%H:%M:%SZ')
+    groups = {}
+    for index, item in enumerate(items):
+        expr, stats = item[0], item[1]
+        panel = item[2] if len(item) > 2 and item[2] else {}
+        interval, max_data_points = panel.get('interval'), panel.get('maxDataPoints')
+
+        key = (normalize_expr(expr), choose_step(start_dt, end_dt, interval, max_data_points))
+        group = groups.setdefault(key, {'expr': expr, 'stats': [], 'interval': interval, 'max_data_points': max_data_points, 'members': []})
+        group['stats'] += [stat for stat in stats if stat not in group['stats']]
+        group['members'].append(index)
+    return list(groups.values())
+
+
+def query_stats_batch(items, start, end, concurrency=None):
+    """
+    并发执行多个 query_stats，多个面板中相同的查询只查询一次（见 plan_queries）
+
+    Args:
+        items: [(expr, stats), ...] 或 [(expr, stats, panel), ...]，panel 中的 interval 和 maxDataPoints 用于选择 step
+    Returns:
+        list: 与 items 顺序一致的 {统计项: 结果}，每个结果都是独立的副本，调用方可以直接修改
+    """
+    groups = plan_queries(items, start, end)
+    if len(groups) < len(items):
+        print(f"{len(items)} 个查询中有重复，合并为 {len(groups)} 个")
+    responses = run_batch(
+        lambda group: query_stats(group['expr'], start, end, group['stats'], group['interval'], group['max_data_points']),
+        groups, concurrency
+    )
+
+    # 所有查询结束后再按大小上限清理查询缓存
+    cache = get_query_cache()
+    if cache is not None:
+        cache.evict()
+
+    results = [None] * len(items)
+    for group, response in zip(groups, responses):
+        for index in group['members']:
+            results[index] = {stat: copy.deepcopy(response[stat]) for stat in items[index][1]}
+    return results
 
 
 
@@ -268,9 +1052,10 @@ if __name__ == '__main__':
     # 查询数据
     data = query_prometheus(expr, start, end)
     
-    # 获取最大值及标签信息
-    max_info = get_max_value_with_labels(data)
-    
+    # 一次遍历同时获取最大值、最小值、平均值
+    results = aggregate(data, ['max', 'min', 'avg', 'p95'])
+    max_info, min_info, avg_info = results['max'], results['min'], results['avg']
+
     # 打印结果
     print("\n===== 最大值查询结果 =====")
     if max_info['value'] is not None:
@@ -280,9 +1065,6 @@ if __name__ == '__main__':
     else:
         print("未找到有效数据")
     
-    # 获取最小值及标签信息
-    min_info = get_min_value_with_labels(data)
-    
     # 打印结果
     print("\n===== 最小值查询结果 =====")
     if min_info['value'] is not None:
@@ -292,9 +1074,6 @@ if __name__ == '__main__':
     else:
         print("未找到有效数据")
     
-    # 获取平均值及相关信息
-    avg_info = get_avg_value_with_labels(data)
-    
     # 打印结果
     print("\n===== 平均值查询结果 =====")
     if avg_info['value'] is not None:
@@ -305,4 +1084,5 @@ if __name__ == '__main__':
 
     print(max_info)
     print(min_info)
-    print(avg_info)
\ No newline at end of file
+    print(avg_info)
+    print(results['p95'])
\ No newline at end of file
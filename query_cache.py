@@ -0,0 +1,65 @@
+from dotenv import load_dotenv
+import utils
+import hashlib
+import gzip
+import json
+import time
+import os
+
+
+class QueryCache:
+    """
+    Prometheus 查询结果的磁盘缓存，报告重新生成时不必再次查询
+
+    缓存键为 (Prometheus 地址, 查询语句, 开始时间, 结束时间, step)，结果按 gzip 压缩的 JSON 存放在
+    <cache_dir>/<sha256 前两位>/<sha256>.json.gz；
+    已经结束的时间范围内数据不会再变化，缓存永不过期，包含当前时间的查询只缓存 ttl 秒；
+    总大小超过上限时按最近使用时间淘汰。
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, ttl=None):
+        self.cache_dir = cache_dir or os.getenv("PROM_CACHE_DIR", ".query_cache")
+        if max_bytes is None:
+            max_bytes = int(utils.get_env_float("PROM_CACHE_MAX_MB", 500) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl is not None else utils.get_env_float("PROM_CACHE_TTL", 60)
+
+
+    def _path(self, key):
+        digest = hashlib.sha256("|".join(str(v) for v in key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json.gz")
+
+
+    def get(self, key):
+        """读取缓存的查询结果，不存在或已过期时返回 None"""
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError, EOFError):
+            return None
+        if entry.get('expires') is not None and entry['expires'] < time.time():
+            return None
+        utils.touch(path)
+        return entry['data']
+
+
+    def put(self, key, data, closed):
+        """
+        写入查询结果
+        closed: 时间范围是否已经结束，结束的时间范围永不过期
+        """
+        entry = {'expires': None if closed else time.time() + self.ttl, 'data': data}
+        utils.write_atomic(self._path(key), lambda f: json.dump(entry, f, separators=(',', ':')), mode='wt')
+
+
+    def evict(self):
+        """缓存总大小超过上限时，删除最久没有使用的文件"""
+        utils.evict_lru(self.cache_dir, self.max_bytes)
+
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    cache = QueryCache()
+    cache.evict()
+    print(f"缓存目录: {cache.cache_dir}")
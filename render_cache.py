@@ -0,0 +1,66 @@
+from dotenv import load_dotenv
+import utils
+import hashlib
+import shutil
+import os
+
+
+class RenderCache:
+    """
+    面板截图缓存，只用于已经结束的时间范围（例如上个月的报告），这些时间范围内的数据不会再变化
+
+    缓存键为 (仪表板 uid, 仪表板版本, 面板 id, 时间范围, 视口大小)，
+    文件按 <cache_dir>/<uid>/<version>/<sha256>.png 存放，仪表板版本变化时删除旧版本的目录；
+    总大小超过上限时按最近使用时间淘汰。
+    """
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.getenv("RENDER_CACHE_DIR", ".render_cache")
+        if max_bytes is None:
+            max_bytes = int(utils.get_env_float("RENDER_CACHE_MAX_MB", 200) * 1024 * 1024)
+        self.max_bytes = max_bytes
+
+
+    def _path(self, uid, version, panel_id, date_from, date_to, viewport):
+        key = "|".join(str(v) for v in (uid, version, panel_id, date_from, date_to, viewport))
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, str(uid), str(version), digest + ".png")
+
+
+    def get(self, uid, version, panel_id, date_from, date_to, viewport):
+        """读取缓存的截图，不存在时返回 None"""
+        path = self._path(uid, version, panel_id, date_from, date_to, viewport)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+        except OSError:
+            return None
+        utils.touch(path)
+        return png
+
+
+    def put(self, uid, version, panel_id, date_from, date_to, viewport, png):
+        utils.write_atomic(self._path(uid, version, panel_id, date_from, date_to, viewport), lambda f: f.write(png))
+
+
+    def invalidate(self, uid, version):
+        """删除该仪表板其他版本的缓存"""
+        uid_dir = os.path.join(self.cache_dir, str(uid))
+        if not os.path.isdir(uid_dir):
+            return
+        for name in os.listdir(uid_dir):
+            if name != str(version):
+                print(f"仪表板 {uid} 版本变化，删除旧版本 {name} 的截图缓存")
+                shutil.rmtree(os.path.join(uid_dir, name), ignore_errors=True)
+
+
+    def evict(self):
+        """缓存总大小超过上限时，删除最久没有使用的文件"""
+        utils.evict_lru(self.cache_dir, self.max_bytes)
+
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    cache = RenderCache()
+    cache.evict()
+    print(f"缓存目录: {cache.cache_dir}")
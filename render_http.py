@@ -0,0 +1,117 @@
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import render_timing
+import utils
+import requests
+import os
+import time
+
+
+class GrafanaRenderer:
+    """
+    通过 Grafana 图片渲染接口 /render/d-solo/{uid} 获取面板 PNG
+    需要 Grafana 安装 grafana-image-renderer 插件（例如 grafana-with-render 镜像），本地不需要 Chromium
+    """
+    def __init__(self, url, api_key, uid, concurrency=None, width=None, height=None, timeout=None):
+        self.url = url
+        self.api_key = api_key
+        self.uid = uid
+        self.concurrency = concurrency or utils.get_env_int("RENDER_CONCURRENCY", 4)
+        self.width = width or utils.get_env_int("RENDER_WIDTH", 1000)
+        self.height = height or utils.get_env_int("RENDER_HEIGHT", 500)
+        self.timeout = timeout or utils.get_env_int("RENDER_TIMEOUT", 120)
+        self.tz = os.getenv("RENDER_TZ")
+        # 截图尺寸，作为截图缓存键的一部分
+        self.viewport = f"{self.width}x{self.height}"
+        self.timing = render_timing.RenderTiming(uid)
+
+        # 连接池大小与并发数一致，所有线程复用 keep-alive 连接
+        self.session = utils.new_session(self.concurrency)
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}"})
+        # 截图结果 {panel_name: PNG 字节}
+        self.images = {}
+
+
+    def render_url(self, uid=None):
+        return f"{self.url}/render/d-solo/{uid or self.uid}/"
+
+
+    def render_panel(self, date_from, date_to, panel_id, panel_name, uid=None):
+        """
+        渲染单个面板
+        uid: 面板所属的仪表板，默认为 self.uid
+        return: 截图成功返回 PNG 字节，失败返回 None
+        """
+        print(f"Processing panel: {panel_name}")
+
+        params = {
+            'orgId': 1,
+            'from': date_from,
+            'to': date_to,
+            'panelId': panel_id,
+            'width': self.width,
+            'height': self.height,
+            # 渲染服务端的等待超时时间，单位秒
+            'timeout': self.timeout
+        }
+        # tz 必须是 IANA 时区（例如 Asia/Shanghai），没有配置时使用渲染服务的默认时区
+        if self.tz:
+            params['tz'] = self.tz
+        try:
+            # 渲染接口在服务端完成打开页面和等待，整个请求计入 wait 阶段
+            with self.timing.phase(panel_id, 'wait', panel_name, uid):
+                response = self.session.get(self.render_url(uid), params=params, timeout=self.timeout + 10)
+        except requests.RequestException as e:
+            print(f"面板 '{panel_name}' 渲染请求失败: {str(e)}")
+            return None
+
+        if response.status_code != 200 or not response.headers.get('Content-Type', '').startswith('image/'):
+            print(f"面板 '{panel_name}' 渲染失败，状态码: {response.status_code}")
+            return None
+
+        with self.timing.phase(panel_id, 'screenshot', panel_name, uid):
+            utils.save_screenshot(panel_name, response.content)
+        return response.content
+
+
+    def _render(self, panel, date_from, date_to):
+        started = time.time()
+        try:
+            png = self.render_panel(date_from=date_from, date_to=date_to, panel_id=panel['id'], panel_name=panel['title'], uid=panel.get('uid'))
+            error = None
+        except Exception as e:
+            print(f"处理面板 '{panel['title']}' 出错: {str(e)}")
+            png, error = None, str(e)
+        if png is not None:
+            self.images[panel['title']] = png
+        return {
+            'uid': panel.get('uid', self.uid),
+            'panel_id': panel['id'],
+            'panel_name': panel['title'],
+            'status': 'success' if png is not None else 'failed',
+            'worker': None,
+            'attempts': 1,
+            'duration': round(time.time() - started, 3),
+            'error': error
+        }
+
+
+    def run(self, panels, date_from, date_to):
+        """
+        并发渲染所有面板，返回值格式与 render_pool.RenderPool.run 一致
+        """
+        print(f"使用 Grafana 渲染接口，并发数 {self.concurrency}，共 {len(panels)} 个面板")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            manifest = list(executor.map(lambda panel: self._render(panel, date_from, date_to), panels))
+        return manifest
+
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    renderer = GrafanaRenderer(
+        url=os.getenv("GF_URL"),
+        api_key=os.getenv("GF_API_KEY"),
+        uid="gw-service"
+    )
+    renderer.render_panel("now-1d", "now", panel_id="3", panel_name="测试面板")
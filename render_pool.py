@@ -0,0 +1,343 @@
+from dotenv import load_dotenv
+import renderer_image
+import render_http
+import grafana_api
+import render_cache
+import render_timing
+import utils
+import grafana_session
+import retry_scheduler
+import threading
+import json
+import os
+import time
+
+
+class RenderPool:
+    """
+    多个已登录的浏览器 worker 组成的截图池
+    所有面板放入同一个调度队列，每个 worker 持有自己的 Chrome，空闲时从队列中取下一个面板，
+    失败的面板按退避时间放回队列末尾
+    """
+    def __init__(self, url, username, password, uid, workers=None, debug="False"):
+        self.url = url
+        self.username = username
+        self.password = password
+        self.uid = uid
+        self.workers = workers or utils.get_env_int("RENDER_WORKERS", 1, minimum=1)
+        self.debug = debug
+        # 截图尺寸，作为截图缓存键的一部分
+        self.viewport = "1920x1080"
+        self.timing = render_timing.RenderTiming(uid)
+        self.session = None
+        self.results = {}
+        # 截图结果 {panel_name: PNG 字节}，直接交给邮件和压缩包使用
+        self.images = {}
+        self.lock = threading.Lock()
+
+
+    def _record(self, index, panel, status, worker_id, task, error=None):
+        """记录单个面板的处理结果，duration 为所有尝试的累计耗时"""
+        with self.lock:
+            self.results[index] = {
+                'uid': panel.get('uid', self.uid),
+                'panel_id': panel['id'],
+                'panel_name': panel['title'],
+                'status': status,
+                'worker': worker_id,
+                'attempts': task['attempts'],
+                'duration': round(task['spent'], 3),
+                'error': error
+            }
+
+
+    def _prepare_session(self):
+        """
+        获取所有 worker 共用的 Grafana 会话
+        优先使用 API Token 或磁盘上未过期的会话；都没有时由第一个浏览器登录一次，并把会话保存到磁盘
+
+        Returns:
+            (session, dashboard): dashboard 为已登录的浏览器，交给第一个 worker 继续使用
+        """
+        api_key = os.getenv("GF_API_KEY")
+        if os.getenv("GF_BROWSER_AUTH") == "token" and api_key:
+            print("浏览器使用 API Token 认证")
+            return grafana_session.build_token_session(self.url, api_key), None
+
+        session = grafana_session.load_session(self.url)
+        if session:
+            return session, None
+
+        dashboard = renderer_image.GrafanaDashboard(self.url, self.username, self.password, self.uid, timing=self.timing)
+        try:
+            dashboard.init_chromium(debug=self.debug)
+            session = dashboard.get_session()
+            grafana_session.save_session(session)
+            return session, dashboard
+        except Exception as e:
+            print(f"登录 Grafana 失败: {str(e)}")
+            if getattr(dashboard, 'driver', None):
+                dashboard.driver.quit()
+            return None, None
+
+
+    def _worker(self, worker_id, scheduler, date_from, date_to, dashboard=None):
+        """worker 线程：初始化浏览器并注入会话，然后不断从队列中取面板截图"""
+        if dashboard is None:
+            dashboard = renderer_image.GrafanaDashboard(self.url, self.username, self.password, self.uid, timing=self.timing)
+            try:
+                dashboard.init_chromium(debug=self.debug, session=self.session)
+            except Exception as e:
+                print(f"worker {worker_id} 初始化浏览器失败: {str(e)}")
+                if getattr(dashboard, 'driver', None):
+                    dashboard.driver.quit()
+                return
+
+        try:
+            while True:
+                task = scheduler.get()
+                if task is None:
+                    break
+                index, panel = task['item']
+                # 多个仪表板一起处理时，面板带有所属仪表板的 uid
+                dashboard.uid = panel.get('uid', self.uid)
+
+                # 单次尝试不在原地重试，失败后交给调度器按退避时间重新排队
+                started = time.time()
+                error = None
+                try:
+                    png = dashboard.render_panel(date_from=date_from, date_to=date_to, panel_id=panel['id'], panel_name=panel['title'],
+                                                 max_retries=1, timeout=scheduler.remaining(task))
+                except Exception as e:
+                    print(f"worker {worker_id} 处理面板 '{panel['title']}' 出错: {str(e)}")
+                    png, error = None, str(e)
+                elapsed = time.time() - started
+
+                if png is not None:
+                    with self.lock:
+                        self.images[panel['title']] = png
+                    scheduler.done(task, elapsed)
+                    self._record(index, panel, 'success', worker_id, task)
+                elif scheduler.retry(task, elapsed):
+                    print(f"面板 '{panel['title']}' 第 {task['attempts']} 次失败，稍后重试")
+                else:
+                    print(f"面板 '{panel['title']}' 共尝试 {task['attempts']} 次仍然失败，跳过该面板。")
+                    self._record(index, panel, 'failed', worker_id, task, error=error)
+        finally:
+            dashboard.driver.quit()
+
+
+    def run(self, panels, date_from, date_to):
+        """
+        将面板分发给所有 worker 并等待完成
+
+        Args:
+            panels: 面板列表，每个元素至少包含 'id' 和 'title'，
+                    即 panel_config['panels']、GrafanaApi.extract_panel_info() 或 grafana_api.collect_panels() 的返回值，
+                    包含 'uid' 时截取该仪表板中的面板
+        Returns:
+            list: 按输入顺序排列的结果清单
+        """
+        scheduler = retry_scheduler.RetryScheduler()
+        for index, panel in enumerate(panels):
+            scheduler.put((index, panel))
+
+        worker_count = min(self.workers, len(panels)) or 1
+        print(f"启动 {worker_count} 个浏览器 worker，共 {len(panels)} 个面板")
+
+        # 只登录一次，其余浏览器直接复用会话
+        self.session, first_dashboard = self._prepare_session()
+
+        threads = []
+        for worker_id in range(worker_count):
+            dashboard = first_dashboard if worker_id == 0 else None
+            t = threading.Thread(target=self._worker, args=(worker_id, scheduler, date_from, date_to, dashboard), daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        # 超过整体截止时间，或所有 worker 都初始化失败时，队列中剩余的面板记为失败
+        error = '超过整体截止时间' if scheduler.expired() else '没有可用的浏览器 worker'
+        for task in scheduler.drain():
+            index, panel = task['item']
+            self._record(index, panel, 'failed', None, task, error=error)
+
+        manifest = []
+        for index, panel in enumerate(panels):
+            if index not in self.results:
+                self.results[index] = {
+                    'uid': panel.get('uid', self.uid),
+                    'panel_id': panel['id'],
+                    'panel_name': panel['title'],
+                    'status': 'failed',
+                    'worker': None,
+                    'attempts': 0,
+                    'duration': 0,
+                    'error': '没有可用的浏览器 worker'
+                }
+            manifest.append(self.results[index])
+
+        return manifest
+
+
+class DashboardRenderer(RenderPool):
+    """
+    整个仪表板只打开一次，截取整页后按 gridPos 裁剪出各个面板
+    适合面板很多的仪表板，N 次页面加载变为 1 次
+    """
+    def __init__(self, url, username, password, api_key, uid, debug="False"):
+        super().__init__(url, username, password, uid, workers=1, debug=debug)
+        self.api_key = api_key
+        self.viewport = f"dashboard-{renderer_image.GRID_WIDTH}"
+
+
+    def run(self, panels, date_from, date_to):
+        """返回值格式与 RenderPool.run 一致，面板来自多个仪表板时每个仪表板打开一次"""
+        started = time.time()
+        groups = {}
+        for index, panel in enumerate(panels):
+            groups.setdefault(panel.get('uid', self.uid), []).append((index, panel))
+
+        self.session, dashboard = self._prepare_session()
+        results = {}
+        error = '整页截图没有返回该面板'
+        try:
+            if dashboard is None:
+                dashboard = renderer_image.GrafanaDashboard(self.url, self.username, self.password, self.uid, timing=self.timing)
+                dashboard.init_chromium(debug=self.debug, session=self.session)
+        except Exception as e:
+            print(f"初始化浏览器失败: {str(e)}")
+            groups, error = {}, str(e)
+
+        for uid, items in groups.items():
+            group_panels = [panel for index, panel in items]
+            try:
+                layout = grafana_api.GrafanaApi(self.url, self.api_key, uid).extract_panel_layout()
+                dashboard.uid = uid
+                group_results, images = dashboard.capture_dashboard(date_from, date_to, group_panels, layout)
+                self.images.update(images)
+            except Exception as e:
+                print(f"仪表板 {uid} 整页截图失败: {str(e)}")
+                group_results = [{'panel_id': p['id'], 'panel_name': p['title'], 'status': 'failed', 'error': str(e)} for p in group_panels]
+            for (index, panel), result in zip(items, group_results):
+                results[index] = result
+
+        if getattr(dashboard, 'driver', None):
+            dashboard.driver.quit()
+
+        duration = round(time.time() - started, 3)
+        manifest = []
+        for index, panel in enumerate(panels):
+            result = results.get(index) or {'panel_id': panel['id'], 'panel_name': panel['title'], 'status': 'failed', 'error': error}
+            result.update({'uid': panel.get('uid', self.uid), 'worker': 0, 'attempts': 1, 'duration': duration})
+            manifest.append(result)
+        return manifest
+
+
+def create_renderer(url, username, password, api_key, uid, debug="False"):
+    """
+    根据环境变量 RENDER_BACKEND 选择截图后端
+    selenium（默认）: 本地浏览器池；http: Grafana 图片渲染接口
+    RENDER_MODE=dashboard 时浏览器只打开一次整个仪表板，按面板位置裁剪
+    """
+    if os.getenv("RENDER_BACKEND", "selenium") == "http":
+        return render_http.GrafanaRenderer(url, api_key, uid)
+    if os.getenv("RENDER_MODE", "panel") == "dashboard":
+        return DashboardRenderer(url, username, password, api_key, uid, debug=debug)
+    return RenderPool(url, username, password, uid, debug=debug)
+
+
+def use_render_cache(date_from, date_to):
+    """render_panels 是否会使用截图缓存：RENDER_CACHE 没有关闭且时间范围已经结束"""
+    return os.getenv("RENDER_CACHE", "True") != "False" and utils.is_closed_window(date_from, date_to)
+
+
+def render_panels(renderer, panels, date_from, date_to, version=None):
+    """
+    截图入口：已经结束的时间范围先从截图缓存读取，只把没有缓存的面板交给 renderer
+
+    Args:
+        renderer: create_renderer() 的返回值
+        version: 仪表板版本（GrafanaApi.get_dashboard_version()），RENDER_CACHE=False 时不使用缓存；
+                 面板包含 'uid' 和 'version'（grafana_api.collect_panels）时使用面板自己的仪表板和版本，
+                 没有版本的面板不使用缓存
+    Returns:
+        list: 与 renderer.run 格式一致的结果清单，命中缓存的面板 status 为 'cached'
+    """
+    def cache_key(panel):
+        return panel.get('uid', renderer.uid), panel.get('version', version)
+
+    if all(cache_key(panel)[1] is None for panel in panels) or not use_render_cache(date_from, date_to):
+        return renderer.run(panels, date_from, date_to)
+
+    cache = render_cache.RenderCache()
+    for uid, panel_version in {cache_key(panel) for panel in panels}:
+        if panel_version is not None:
+            cache.invalidate(uid, panel_version)
+
+    cached = {}
+    missing = []
+    for index, panel in enumerate(panels):
+        uid, panel_version = cache_key(panel)
+        png = cache.get(uid, panel_version, panel['id'], date_from, date_to, renderer.viewport) if panel_version is not None else None
+        if png is None:
+            missing.append(panel)
+            continue
+        cached[index] = {
+            'uid': uid,
+            'panel_id': panel['id'],
+            'panel_name': panel['title'],
+            'status': 'cached',
+            'worker': None,
+            'attempts': 0,
+            'duration': 0,
+            'error': None
+        }
+        renderer.images[panel['title']] = png
+        utils.save_screenshot(panel['title'], png)
+    print(f"截图缓存命中 {len(cached)} 个面板，需要渲染 {len(missing)} 个面板")
+
+    rendered = iter(renderer.run(missing, date_from, date_to) if missing else [])
+    manifest = []
+    for index, panel in enumerate(panels):
+        if index in cached:
+            manifest.append(cached[index])
+            continue
+        result = next(rendered)
+        uid, panel_version = cache_key(panel)
+        if result['status'] == 'success' and panel['title'] in renderer.images and panel_version is not None:
+            cache.put(uid, panel_version, panel['id'], date_from, date_to, renderer.viewport, renderer.images[panel['title']])
+        manifest.append(result)
+
+    cache.evict()
+    return manifest
+
+
+def write_manifest(manifest, manifest_file="render_manifest.json"):
+    """将截图结果清单写入文件"""
+    summary = {
+        'total': len(manifest),
+        'success': len([m for m in manifest if m['status'] in ('success', 'cached')]),
+        'cached': len([m for m in manifest if m['status'] == 'cached']),
+        'failed': len([m for m in manifest if m['status'] == 'failed']),
+        'panels': manifest
+    }
+    with open(manifest_file, 'w', encoding="utf-8") as f:
+        json.dump(summary, f, indent=4, ensure_ascii=False)
+    print(f"截图结果清单保存到：{manifest_file}，成功 {summary['success']} 个（缓存 {summary['cached']} 个），失败 {summary['failed']} 个")
+    return summary
+
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    pool = RenderPool(
+        url=os.getenv("GF_URL"),
+        username=os.getenv("GF_USER"),
+        password=os.getenv("GF_PASSWORD"),
+        uid="gw-service",
+        debug=os.getenv("CHROME_DEBUG")
+    )
+    manifest = pool.run([{'id': '3', 'title': '测试面板'}], "now-1d", "now")
+    write_manifest(manifest)
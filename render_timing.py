@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+import threading
+import json
+import os
+import time
+
+
+class RenderTiming:
+    """
+    记录截图过程中各阶段的耗时
+
+    面板阶段：navigation（打开页面/切换面板）、wait（等待面板加载）、screenshot（截图和编码）、retry（重试次数）
+    运行阶段：login（登录或注入会话）以及所有面板阶段的合计
+    多个仪表板的面板 id 可能相同，面板按 (仪表板 uid, panel_id) 区分，没有指定 uid 时使用 self.uid
+    """
+    def __init__(self, uid=None):
+        self.uid = uid
+        self.started = time.time()
+        self.panels = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+
+
+    def _panel(self, panels, panel_id, uid):
+        uid = uid or self.uid
+        return panels.setdefault((uid, str(panel_id)), {'uid': uid, 'panel_id': str(panel_id), 'panel_name': None, 'phases': {}, 'retries': 0})
+
+
+    def add(self, panel_id, phase, seconds, panel_name=None, uid=None):
+        """累加一个阶段的耗时，panel_id 为 None 时只计入运行合计"""
+        with self.lock:
+            self.totals[phase] = self.totals.get(phase, 0) + seconds
+            if panel_id is None:
+                return
+            panel = self._panel(self.panels, panel_id, uid)
+            if panel_name:
+                panel['panel_name'] = panel_name
+            panel['phases'][phase] = panel['phases'].get(phase, 0) + seconds
+
+
+    def count_retry(self, panel_id, uid=None):
+        with self.lock:
+            self._panel(self.panels, panel_id, uid)['retries'] += 1
+
+
+    @contextmanager
+    def phase(self, panel_id, phase, panel_name=None, uid=None):
+        """with timing.phase(panel_id, 'navigation'): ..."""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add(panel_id, phase, time.time() - started, panel_name, uid)
+
+
+    def summary(self, manifest=None):
+        """汇总运行总耗时、各阶段合计和每个面板的耗时，manifest 为截图结果清单，用于补充状态和调度器重试次数"""
+        panels = {key: dict(value, phases=dict(value['phases'])) for key, value in self.panels.items()}
+        for result in manifest or []:
+            panel = self._panel(panels, result['panel_id'], result.get('uid'))
+            panel['panel_name'] = result['panel_name']
+            panel['status'] = result['status']
+            # 调度器放回队列的次数也算作重试
+            panel['retries'] += max(result.get('attempts', 1) - 1, 0)
+
+        return {
+            'uid': self.uid,
+            'run_seconds': round(time.time() - self.started, 3),
+            'totals': {phase: round(seconds, 3) for phase, seconds in self.totals.items()},
+            'panels': [
+                dict(panel, phases={phase: round(seconds, 3) for phase, seconds in panel['phases'].items()})
+                for panel in panels.values()
+            ]
+        }
+
+
+    def write(self, manifest=None, output_dir=None):
+        """
+        写入 render_timing.json 和 Prometheus textfile collector 格式的 render_timing.prom，
+        默认与 monitor_data.json 放在同一目录
+        """
+        output_dir = output_dir or os.getenv("RENDER_TIMING_DIR", ".")
+        os.makedirs(output_dir, exist_ok=True)
+        summary = self.summary(manifest)
+
+        json_file = os.path.join(output_dir, "render_timing.json")
+        with open(json_file, 'w', encoding="utf-8") as f:
+            json.dump(summary, f, indent=4, ensure_ascii=False)
+
+        # textfile collector 可能随时读取，先写临时文件再改名
+        prom_file = os.path.join(output_dir, "render_timing.prom")
+        with open(prom_file + ".tmp", 'w', encoding="utf-8") as f:
+            f.write(to_prometheus_text(summary))
+        os.replace(prom_file + ".tmp", prom_file)
+
+        print(f"截图耗时统计保存到：{json_file}，{prom_file}")
+        return summary
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def panel_labels(panel):
+    return f'uid="{escape_label(panel["uid"] or "")}",panel_id="{escape_label(panel["panel_id"])}",panel="{escape_label(panel["panel_name"] or "")}"'
+
+
+def to_prometheus_text(summary):
+    """将耗时汇总转换为 Prometheus 文本格式"""
+    uid = escape_label(summary['uid'] or '')
+    lines = [
+        "# HELP grafana_capture_run_seconds Wall time of the whole render run.",
+        "# TYPE grafana_capture_run_seconds gauge",
+        f'grafana_capture_run_seconds{{uid="{uid}"}} {summary["run_seconds"]}',
+        "# HELP grafana_capture_phase_seconds Time spent in each render phase, summed over all panels.",
+        "# TYPE grafana_capture_phase_seconds gauge",
+    ]
+    for phase, seconds in summary['totals'].items():
+        lines.append(f'grafana_capture_phase_seconds{{uid="{uid}",phase="{escape_label(phase)}"}} {seconds}')
+
+    lines += [
+        "# HELP grafana_capture_panel_phase_seconds Time spent in each render phase per panel.",
+        "# TYPE grafana_capture_panel_phase_seconds gauge",
+    ]
+    for panel in summary['panels']:
+        labels = panel_labels(panel)
+        for phase, seconds in panel['phases'].items():
+            lines.append(f'grafana_capture_panel_phase_seconds{{{labels},phase="{escape_label(phase)}"}} {seconds}')
+
+    lines += [
+        "# HELP grafana_capture_panel_retries Number of retries per panel.",
+        "# TYPE grafana_capture_panel_retries gauge",
+    ]
+    for panel in summary['panels']:
+        labels = panel_labels(panel)
+        lines.append(f'grafana_capture_panel_retries{{{labels}}} {panel["retries"]}')
+
+    return "\n".join(lines) + "\n"
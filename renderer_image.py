@@ -6,19 +6,45 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException
+import grafana_session
+import utils
+import panel_ready
+import render_timing
+from PIL import Image
+import base64
+import io
 import re
 import os
 import time
 
 
+# Grafana 仪表板网格参数：24 列，每行 30px，面板间距 8px
+GRID_COLUMNS = 24
+GRID_ROW_HEIGHT = 30
+GRID_MARGIN = 8
+# 整页截图时的窗口宽度和网格上方预留的高度
+GRID_WIDTH = 1920
+GRID_TOP = 200
+
+
 class GrafanaDashboard:
-    def __init__(self, url, username, password, uid):
+    def __init__(self, url, username, password, uid, spa_navigation=None, timing=None):
         self.url = url
         self.username = username
         self.password = password
         self.uid = uid
-
-    def init_chromium(self, debug):
+        # 各阶段耗时统计，浏览器池中所有 worker 共用一个
+        self.timing = timing or render_timing.RenderTiming(uid)
+        # 在同一个标签页内通过前端路由切换面板，不重新加载整个仪表板
+        self.spa_navigation = os.getenv("SPA_NAVIGATION", "False") == "True" if spa_navigation is None else spa_navigation
+        # 当前标签页已加载的仪表板和时间范围
+        self.current_dashboard = None
+
+    def init_chromium(self, debug, session=None):
+        """
+        启动浏览器并完成认证
+        session: grafana_session 中的会话，传入时直接注入 cookie 或请求头，跳过登录页面
+        """
         # 配置Chrome浏览器选项（无界面浏览器）
         chrome_options = Options()
         chrome_options.add_argument("--no-sandbox")
@@ -42,6 +68,21 @@ class GrafanaDashboard:
         # 初始化浏览器
         driver = webdriver.Chrome(options=chrome_options, service=service)
         driver.set_window_size(1920, 1080)
+        self.driver = driver
+
+        # 注入面板加载检测脚本，之后打开的每个页面都会生效
+        panel_ready.install(driver)
+
+        with self.timing.phase(None, 'login'):
+            if session:
+                self.apply_session(session)
+            else:
+                self.login()
+
+
+    def login(self):
+        """通过 /login 页面登录"""
+        driver = self.driver
 
         # 打开 Grafana 登录页面
         grafana_url = f"{self.url}" + "/login"
@@ -60,14 +101,31 @@ class GrafanaDashboard:
         password_input.send_keys(self.password)
         login_button.click()
 
-        # 等待登录完成，第一个面板可见
+        # 等待登录完成，页面离开 /login 即表示会话 cookie 已写入
         WebDriverWait(driver, 60).until(
-            EC.presence_of_element_located(
-                (By.XPATH, '//*[@class="css-itdw1b-panel-container"]')
-            )
+            lambda d: "/login" not in d.current_url
         )
 
-        self.driver = driver
+
+    def apply_session(self, session):
+        """将已有会话注入浏览器，不再经过登录页面"""
+        driver = self.driver
+
+        if session.get('headers'):
+            # API Token 方式：所有请求都带上认证头
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setExtraHTTPHeaders", {"headers": session['headers']})
+
+        if session.get('cookies'):
+            # cookie 只能写入当前域名，先打开一个不启动 Grafana 前端的轻量页面
+            driver.get(f"{self.url}" + "/robots.txt")
+            for cookie in session['cookies']:
+                driver.add_cookie(cookie)
+
+
+    def get_session(self):
+        """获取当前浏览器的登录会话，用于注入其他浏览器或保存到磁盘"""
+        return grafana_session.build_cookie_session(self.url, self.driver.get_cookies())
 
 
     def wait_for_element(self, xpath, timeout=60):
@@ -115,60 +173,220 @@ class GrafanaDashboard:
 
 
 
-    def open_chart_panel(self, date_from, date_to, panel_id, max_retries=3, retry_interval=5):
-        """打开指定的图表面板并等待其加载完成"""
+    def open_chart_panel(self, date_from, date_to, panel_id, max_retries=3, retry_interval=5, timeout=600):
+        """打开指定的图表面板并等待其加载完成，timeout 为每次等待面板加载的最长时间（秒）"""
         # 构建仪表板URL
         dashboard_url = self.url + f"/d/{self.uid}/?orgId=1&from={date_from}&to={date_to}&timezone=browser&viewPanel=panel-{panel_id}&refresh=1d"
         
-        # 打开图表页面
-        print(f"正在打开图表页面: {dashboard_url}")
-        self.driver.get(dashboard_url)
-
-        # 等待仪表板加载完成
-        self.wait_for_element('//*[@class="css-itdw1b-panel-container"]')
-        self.wait_for_element_disappear('//*[@class="css-1p4srcl-Icon"]', timeout=600)
+        # 打开图表页面，同一个仪表板和时间范围时优先在页面内切换面板
+        with self.timing.phase(panel_id, 'navigation', uid=self.uid):
+            if self.spa_navigation and self.current_dashboard == (self.uid, date_from, date_to) \
+                    and panel_ready.navigate_in_app(self.driver, dashboard_url[len(self.url):]):
+                print(f"在当前页面切换到图表: {dashboard_url}")
+            else:
+                print(f"正在打开图表页面: {dashboard_url}")
+                self.driver.get(dashboard_url)
+        self.current_dashboard = (self.uid, date_from, date_to)
 
         # 检查面板是否成功加载，如果没有加载成功，则重试
         retries = 0
         success = False
         while retries < max_retries:
-            # 检查是否存在感叹号或"No data"
-            if self.check_xpath_element(xpath='//*[@class="css-om0k8z-toolbar-button-panel-header-state-button"]') or self.check_text_element("No data"):
-                print(f"第 {retries + 1} 次打开图表失败，正在重试...")
+            # 检查数据请求是否报错或"No data"
+            with self.timing.phase(panel_id, 'wait', uid=self.uid):
+                loaded = self.wait_for_panel(timeout=timeout)
+            if not loaded:
                 retries += 1
+                if retries >= max_retries:
+                    print(f"第 {retries} 次打开图表失败")
+                    break
+                print(f"第 {retries} 次打开图表失败，正在重试...")
+                self.timing.count_retry(panel_id, uid=self.uid)
                 time.sleep(retry_interval)
-                self.driver.refresh()
-                self.wait_for_element('//*[@class="css-itdw1b-panel-container"]')
-                self.wait_for_element_disappear('//*[@class="css-1p4srcl-Icon"]', timeout=600)
+                with self.timing.phase(panel_id, 'navigation', uid=self.uid):
+                    self.driver.refresh()
             else:
                 print("图表成功加载")
                 success = True
                 break
         
         return success
+
+
+    def wait_for_panel(self, timeout=600):
+        """等待面板的数据请求全部结束并绘制完成，返回面板是否加载成功"""
+        status = panel_ready.wait_for_panel_ready(self.driver, timeout=timeout)
+
+        if not status['installed']:
+            # 检测脚本没有生效时，退回到等待加载图标消失的方式
+            self.wait_for_element('//*[@class="css-itdw1b-panel-container"]')
+            self.wait_for_element_disappear('//*[@class="css-1p4srcl-Icon"]', timeout=timeout)
+        elif not status['ready']:
+            print(f"面板在 {timeout} 秒内没有加载完成")
+            return False
+        elif status['errors']:
+            print(f"面板数据请求出错: {status['errors']}")
+            return False
+
+        return not self.check_text_element("No data")
     
 
 
-    def render_panel(self, date_from, date_to, panel_id, panel_name, max_retries=3, retry_interval=5):
+    def render_panel(self, date_from, date_to, panel_id, panel_name, max_retries=3, retry_interval=5, timeout=600):
         """
         panel_type: 面板类型，例如 'stat', 'table', 'graph', 'legend table' 等
+        timeout: 等待面板加载的最长时间（秒）
+        return: 截图成功返回 PNG 字节，失败返回 None
         """
         print(f"Processing panel: {panel_name}")
 
-        # 创建存储目录
-        os.makedirs("screenshots", exist_ok=True)
-
         # 打开图表面板
-        success = self.open_chart_panel(date_from, date_to, panel_id, max_retries, retry_interval)
+        success = self.open_chart_panel(date_from, date_to, panel_id, max_retries, retry_interval, timeout)
         if not success:
             print(f"面板 '{panel_name}' 重试 {max_retries} 次仍然失败，跳过该面板。")
-            return
+            return None
+
+        with self.timing.phase(panel_id, 'screenshot', panel_name, uid=self.uid):
+            # 定位目标 panel 元素
+            panel = self.driver.find_element(By.XPATH, '//*[@class="css-itdw1b-panel-container"]')
+            # 通过 DevTools 截取 panel 所在区域，图片直接保存在内存中
+            png = self.capture_png(self.element_rect(panel))
+            utils.save_screenshot(panel_name, png)
+        return png
+
+
+    def element_rect(self, element):
+        """获取元素相对于整个页面的位置（CSS 像素）"""
+        return self.driver.execute_script("""
+            var rect = arguments[0].getBoundingClientRect();
+            return {x: rect.left + window.scrollX, y: rect.top + window.scrollY, width: rect.width, height: rect.height};
+        """, element)
+
+
+    def capture_png(self, rect):
+        """通过 DevTools 的 Page.captureScreenshot 截取页面中的矩形区域，返回 PNG 字节"""
+        result = self.driver.execute_cdp_cmd("Page.captureScreenshot", {
+            "format": "png",
+            "captureBeyondViewport": True,
+            "clip": {"x": rect['x'], "y": rect['y'], "width": rect['width'], "height": rect['height'], "scale": 1}
+        })
+        return base64.b64decode(result['data'])
+
+
+    def expand_rows(self):
+        """展开仪表板中所有折叠的行"""
+        xpath = '//button[@aria-expanded="false"][contains(@data-testid, "dashboard-row-title")]'
+        # 每次展开后页面结构会变化，需要重新查找
+        for _ in range(100):
+            buttons = self.driver.find_elements(By.XPATH, xpath)
+            if not buttons:
+                break
+            try:
+                buttons[0].click()
+            except (StaleElementReferenceException, ElementNotInteractableException):
+                continue
 
-        # 定位目标 panel 元素
-        panel = self.driver.find_element(By.XPATH, '//*[@class="css-itdw1b-panel-container"]')
-        # 对 panel 元素进行截图
-        panel.screenshot(f"screenshots/{panel_name + '.png'}")
-        print(f"截图保存到：screenshots/{panel_name + '.png'}")
+
+    def panel_rects(self, panel_ids):
+        """
+        按面板 id 在页面中查找面板元素的位置（CSS 像素，相对于整个页面）
+        兼容旧版本的 data-panelid 和 Scenes 版本的 data-viz-panel-key，取所在的网格项作为面板边界
+        return: {面板 id 字符串: rect}，页面中不存在的面板不在结果中
+        """
+        return self.driver.execute_script("""
+            var rects = {};
+            arguments[0].forEach(function (id) {
+                var el = document.querySelector('[data-panelid="' + id + '"]') || document.querySelector('[data-viz-panel-key="panel-' + id + '"]');
+                if (!el) { return; }
+                el = el.closest('.react-grid-item') || el;
+                var rect = el.getBoundingClientRect();
+                if (rect.width > 0 && rect.height > 0) {
+                    rects[id] = {x: rect.left + window.scrollX, y: rect.top + window.scrollY, width: rect.width, height: rect.height};
+                }
+            });
+            return rects;
+        """, [str(panel_id) for panel_id in panel_ids]) or {}
+
+
+    def capture_dashboard(self, date_from, date_to, panels, layout, timeout=600):
+        """
+        只打开一次整个仪表板，截取整页后裁剪出每个面板
+        裁剪位置优先取面板元素在页面中的实际位置，找不到元素时才按 gridPos 计算
+
+        Args:
+            panels: 面板列表，每个元素至少包含 'id' 和 'title'
+            layout: GrafanaApi.extract_panel_layout() 的返回值
+        Returns:
+            (results, images): results 为每个面板的处理结果 {'panel_id', 'panel_name', 'status', 'error'}，
+                               images 为 {panel_name: PNG 字节}
+        """
+        # 窗口高度足够容纳全部面板，避免 Grafana 懒加载视口外的面板
+        bottom = max([pos['y'] + pos['h'] for pos in layout.values()] or [0])
+        self.driver.set_window_size(GRID_WIDTH, GRID_TOP + bottom * (GRID_ROW_HEIGHT + GRID_MARGIN))
+
+        dashboard_url = self.url + f"/d/{self.uid}/?orgId=1&from={date_from}&to={date_to}&timezone=browser&kiosk"
+        print(f"正在打开仪表板: {dashboard_url}")
+        with self.timing.phase(None, 'navigation'):
+            self.driver.get(dashboard_url)
+            self.current_dashboard = None
+        with self.timing.phase(None, 'wait'):
+            # 前端挂载仪表板网格后才能找到行标题，展开折叠的行后新面板会发出请求，需要重新等待加载完成
+            try:
+                WebDriverWait(self.driver, min(timeout, 60)).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, '.react-grid-layout')))
+            except Exception:
+                print("仪表板网格没有出现")
+            panel_ready.wait_for_panel_ready(self.driver, timeout=timeout)
+            self.expand_rows()
+            status = panel_ready.wait_for_panel_ready(self.driver, timeout=timeout)
+        if not status['ready']:
+            print(f"仪表板在 {timeout} 秒内没有加载完成，继续截图")
+
+        # 网格容器位置，react-grid-layout 的类名不带哈希
+        grid = self.driver.execute_script("""
+            var grid = document.querySelector('.react-grid-layout');
+            if (!grid) { return null; }
+            var rect = grid.getBoundingClientRect();
+            return {left: rect.left + window.scrollX, top: rect.top + window.scrollY, width: rect.width, innerWidth: window.innerWidth};
+        """)
+        if not grid:
+            return [{'panel_id': p['id'], 'panel_name': p['title'], 'status': 'failed', 'error': '未找到仪表板网格'} for p in panels], {}
+
+        with self.timing.phase(None, 'screenshot'):
+            page = Image.open(io.BytesIO(self.driver.get_screenshot_as_png()))
+        # 截图像素与 CSS 像素的比例（高分屏下大于 1）
+        ratio = page.width / grid['innerWidth']
+        col_width = (grid['width'] - GRID_MARGIN * (GRID_COLUMNS - 1)) / GRID_COLUMNS
+        rects = self.panel_rects([panel['id'] for panel in panels])
+
+        results = []
+        images = {}
+        for panel in panels:
+            rect = rects.get(str(panel['id']))
+            pos = layout.get(str(panel['id']))
+            if rect is None and pos is None:
+                results.append({'panel_id': panel['id'], 'panel_name': panel['title'], 'status': 'failed', 'error': '仪表板中不存在该面板'})
+                continue
+
+            if rect is not None:
+                left, top, width, height = rect['x'], rect['y'], rect['width'], rect['height']
+            else:
+                # 页面中找不到面板元素（例如不同版本的 Grafana），按 gridPos 计算，假设所有折叠的行都已展开
+                print(f"页面中没有找到面板 '{panel['title']}'，按 gridPos 计算位置")
+                left = grid['left'] + pos['x'] * (col_width + GRID_MARGIN)
+                top = grid['top'] + pos['y'] * (GRID_ROW_HEIGHT + GRID_MARGIN)
+                width = pos['w'] * col_width + (pos['w'] - 1) * GRID_MARGIN
+                height = pos['h'] * GRID_ROW_HEIGHT + (pos['h'] - 1) * GRID_MARGIN
+            box = tuple(round(v * ratio) for v in (left, top, left + width, top + height))
+
+            with self.timing.phase(panel['id'], 'screenshot', panel['title'], uid=self.uid):
+                buffer = io.BytesIO()
+                page.crop(box).save(buffer, format="PNG")
+                images[panel['title']] = buffer.getvalue()
+                utils.save_screenshot(panel['title'], images[panel['title']])
+            results.append({'panel_id': panel['id'], 'panel_name': panel['title'], 'status': 'success', 'error': None})
+
+        return results, images
 
 
 
@@ -0,0 +1,118 @@
+import utils
+import heapq
+import itertools
+import threading
+import random
+import time
+
+
+class RetryScheduler:
+    """
+    截图任务调度队列，多个 worker 线程共用
+
+    失败的面板不在原地重试，而是按指数退避加随机抖动放回队列末尾，其他面板可以先处理；
+    每个面板有累计耗时上限（panel_budget），整个运行有截止时间（deadline），超过后不再重试。
+    """
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None, panel_budget=None, deadline=None):
+        self.max_attempts = max_attempts or int(utils.get_env_float("RENDER_MAX_ATTEMPTS", 3))
+        self.base_delay = base_delay if base_delay is not None else utils.get_env_float("RENDER_RETRY_BASE", 5)
+        self.max_delay = max_delay if max_delay is not None else utils.get_env_float("RENDER_RETRY_MAX", 60)
+        self.panel_budget = panel_budget or utils.get_env_float("RENDER_PANEL_BUDGET", 600)
+        # 整个运行的时长上限（秒），0 表示不限制
+        deadline = deadline if deadline is not None else utils.get_env_float("RENDER_DEADLINE", 0)
+        self.deadline = time.time() + deadline if deadline else None
+
+        self.heap = []
+        self.seq = itertools.count()
+        # 还没有结束的任务数量（包括队列中和正在处理的）
+        self.pending = 0
+        self.cond = threading.Condition()
+
+
+    def put(self, item, delay=0):
+        """加入一个新任务"""
+        task = {'item': item, 'attempts': 0, 'spent': 0.0}
+        with self.cond:
+            self.pending += 1
+            heapq.heappush(self.heap, (time.time() + delay, next(self.seq), task))
+            self.cond.notify()
+        return task
+
+
+    def get(self):
+        """
+        取出下一个已到重试时间的任务，没有时阻塞等待
+        所有任务都结束或超过截止时间时返回 None
+        """
+        with self.cond:
+            while True:
+                now = time.time()
+                if self.deadline and now >= self.deadline:
+                    return None
+                if self.heap and self.heap[0][0] <= now:
+                    return heapq.heappop(self.heap)[2]
+                if self.pending == 0:
+                    return None
+
+                # 等到队首任务可以重试，或者有其他任务结束/放回
+                timeout = self.heap[0][0] - now if self.heap else None
+                if self.deadline:
+                    timeout = min(timeout, self.deadline - now) if timeout is not None else self.deadline - now
+                self.cond.wait(timeout)
+
+
+    def remaining(self, task):
+        """当前任务本次可以使用的时间（秒），取面板剩余预算和整体截止时间中较小的一个"""
+        remaining = self.panel_budget - task['spent']
+        if self.deadline:
+            remaining = min(remaining, self.deadline - time.time())
+        return max(remaining, 0)
+
+
+    def done(self, task, elapsed=0):
+        """任务结束（成功或放弃）"""
+        with self.cond:
+            task['attempts'] += 1
+            task['spent'] += elapsed
+            self.pending -= 1
+            self.cond.notify_all()
+
+
+    def retry(self, task, elapsed):
+        """
+        任务失败，按指数退避放回队列
+        return: 放回队列返回 True；超过重试次数、面板预算或截止时间时放弃并返回 False
+        """
+        with self.cond:
+            task['attempts'] += 1
+            task['spent'] += elapsed
+
+            delay = min(self.max_delay, self.base_delay * 2 ** (task['attempts'] - 1))
+            # 随机抖动，避免多个失败面板同时重试同一个数据源
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            ready_at = time.time() + delay
+
+            if task['attempts'] >= self.max_attempts or task['spent'] >= self.panel_budget \
+                    or (self.deadline and ready_at >= self.deadline):
+                self.pending -= 1
+                self.cond.notify_all()
+                return False
+
+            heapq.heappush(self.heap, (ready_at, next(self.seq), task))
+            self.cond.notify_all()
+            return True
+
+
+    def expired(self):
+        """是否已经超过整体截止时间"""
+        return bool(self.deadline) and time.time() >= self.deadline
+
+
+    def drain(self):
+        """返回队列中尚未处理的任务（超过截止时间或没有 worker 可以处理）"""
+        with self.cond:
+            tasks = [entry[2] for entry in self.heap]
+            self.heap = []
+            self.pending -= len(tasks)
+            self.cond.notify_all()
+            return tasks
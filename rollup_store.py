@@ -0,0 +1,96 @@
+from dotenv import load_dotenv
+from contextlib import contextmanager
+import sqlite3
+import json
+import os
+
+
+class RollupStore:
+    """
+    按天预聚合的统计结果，保存在 SQLite 中
+
+    每个查询语句每天一行，记录样本数、总和以及最大值、最小值、最后一个值对应的标签和时间戳，
+    本月至今、本周等报告只需要查询存储中还没有的日期，再与已有的日汇总合并。
+    只保存已经结束的整天，结束的时间范围内数据不会再变化。
+    """
+    def __init__(self, db_file=None):
+        self.db_file = db_file or os.getenv("PROM_ROLLUP_DB", ".rollup.db")
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS daily_rollup (
+                    key TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    max_value REAL, max_labels TEXT, max_timestamp REAL,
+                    min_value REAL, min_labels TEXT, min_timestamp REAL,
+                    last_value REAL, last_labels TEXT, last_timestamp REAL,
+                    PRIMARY KEY (key, day)
+                )
+            """)
+
+
+    @contextmanager
+    def _connect(self):
+        # 多个查询线程同时读写，每次操作使用独立的连接，结束时提交并关闭
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+    @staticmethod
+    def make_key(*parts):
+        """由 Prometheus 地址、查询语句等组成的键"""
+        return json.dumps([str(part) if part is not None else None for part in parts], ensure_ascii=False)
+
+
+    def get(self, key, days):
+        """
+        读取多天的日汇总
+        return: {day: state}，state 格式见 prometheus_data.Aggregator.state，不存在的日期不在结果中
+        """
+        if not days:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM daily_rollup WHERE key = ? AND day IN ({','.join('?' * len(days))})",
+                [key] + list(days)
+            ).fetchall()
+
+        def point(value, labels, timestamp):
+            return None if value is None else (value, json.loads(labels), timestamp)
+
+        return {
+            row[1]: {
+                'count': row[2],
+                'total': row[3],
+                'max': point(*row[4:7]),
+                'min': point(*row[7:10]),
+                'last': point(*row[10:13]),
+            }
+            for row in rows
+        }
+
+
+    def put(self, key, day, state):
+        def point(value):
+            return (value[0], json.dumps(value[1], ensure_ascii=False), value[2]) if value else (None, None, None)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO daily_rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, day, state['count'], state['total'], *point(state['max']), *point(state['min']), *point(state['last']))
+            )
+
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    store = RollupStore()
+    with store._connect() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM daily_rollup").fetchone()[0]
+    print(f"日汇总数据库: {store.db_file}，共 {count} 行")
@@ -18,14 +18,20 @@ import base64
 
 
 # 打包文件
-def zip_files(source_dir, zip_filename):
+def zip_files(source_dir, zip_filename, images=None):
     """
     zip_files 的 Docstring
     
     :param source_dir: 要打包的目录
     :param zip_filename: 打包后的文件名
+    :param images: 内存中的截图 {panel_name: PNG 字节}，传入时直接写入压缩包，不再读取目录
     """
     with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        if images is not None:
+            for panel_name, png in images.items():
+                zipf.writestr(panel_name + '.png', png)
+            return
+
         for foldername, subfolders, filenames in os.walk(source_dir):
             for filename in filenames:
                 filepath = os.path.join(foldername, filename)
@@ -53,16 +59,22 @@ def get_image_base64(image_path):
         return None
 
 
-def get_all_screenshots(screenshots_dir='./screenshots'):
+def get_all_screenshots(screenshots_dir='./screenshots', images=None):
     """
     获取所有截图并转换为Base64格式
     
     Args:
         screenshots_dir: 截图目录
+        images: 内存中的截图 {panel_name: PNG 字节}，传入时不再读取截图目录
     Returns:
         dict: {panel_name: base64_string}
     """
     screenshots = {}
+
+    if images is not None:
+        for panel_name, png in images.items():
+            screenshots[panel_name] = f"data:image/png;base64,{base64.b64encode(png).decode('utf-8')}"
+        return screenshots
     
     if not os.path.exists(screenshots_dir):
         print(f"Warning: Screenshots directory {screenshots_dir} does not exist")
@@ -146,13 +158,14 @@ def send_email(zip_filename, to_email, subject=None, body=None, from_email=None,
         print(f"Failed to send email: {e}")
 
 
-def get_email_content(json_file='monitor_data.json', screenshots_dir='./screenshots'):
+def get_email_content(json_file='monitor_data.json', screenshots_dir='./screenshots', images=None):
     """
     生成邮件内容的HTML报告，包含截图
     
     Args:
         json_file: 包含监控数据的JSON文件路径
         screenshots_dir: 截图目录
+        images: 内存中的截图 {panel_name: PNG 字节}
     Returns:
         HTML内容字符串
     """
@@ -160,7 +173,7 @@ def get_email_content(json_file='monitor_data.json', screenshots_dir='./screensh
         json_data = json.load(f)
     
     # 获取所有截图
-    screenshots = get_all_screenshots(screenshots_dir)
+    screenshots = get_all_screenshots(screenshots_dir, images)
 
     # 按panel_name分组数据
     grouped_data = {}
@@ -584,6 +597,8 @@ def get_email_content(json_file='monitor_data.json', screenshots_dir='./screensh
             value = item.get('value', 0)
             labels = item.get('labels', {})
             timestamp = item.get('timestamp_formatted', '')
+            # 同一个面板有多个统计项时，在名称后标注统计项
+            metric_name = f"{panel_name} ({item['stat']})" if item.get('stat') and len(items) > 1 else panel_name
             
             # 根据数值确定严重程度
             severity_class = "severity-normal"
@@ -618,7 +633,7 @@ def get_email_content(json_file='monitor_data.json', screenshots_dir='./screensh
             html_template += f'''
                         <div class="metric-card {severity_class}">
                             <div class="metric-header">
-                                <div class="metric-name">{panel_name}</div>
+                                <div class="metric-name">{metric_name}</div>
                             </div>
                             <div class="metric-value">{formatted_value}</div>
                             {labels_html}
@@ -698,7 +713,11 @@ def get_email_content(json_file='monitor_data.json', screenshots_dir='./screensh
     return html_template
 
 
-def send_email_now(name=""):
+def send_email_now(name="", images=None):
+    """
+    打包截图并发送巡检报告
+    images: 内存中的截图 {panel_name: PNG 字节}，为 None 时从 screenshots 目录读取
+    """
     source_dir = "./screenshots"
     temp_dir = tempfile.mkdtemp()
     zip_filename = os.path.join(temp_dir, name + "_巡检报告_" + utils.get_year_month(os.getenv("DATE_FROM")) + ".zip")
@@ -712,9 +731,9 @@ def send_email_now(name=""):
     smtp_port = int(os.getenv('SMTP_PORT', 465))
 
     # 打包文件
-    zip_files(source_dir, zip_filename)
+    zip_files(source_dir, zip_filename, images)
 
-    body = get_email_content()
+    body = get_email_content(images=images)
 
     # 发送邮件
     send_email(zip_filename=zip_filename, to_email=to_email, subject='巡检报告', body=body, 
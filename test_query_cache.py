@@ -0,0 +1,99 @@
+"""
+query_cache.QueryCache 的测试，通过 prometheus_data.query_prometheus 查询本地 http.server 模拟的 Prometheus
+运行: python -m pytest -q test_query_cache.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+from unittest import mock
+import threading
+import tempfile
+import unittest
+import shutil
+import json
+import os
+
+import prometheus_data
+
+
+class FakePrometheusHandler(BaseHTTPRequestHandler):
+    """query_range 返回一条固定的序列，记录请求次数"""
+    count = 0
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/api/v1/query_range':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        FakePrometheusHandler.count += 1
+        body = json.dumps({'status': 'success', 'data': {'resultType': 'matrix', 'result': [
+            {'metric': {'pod': 'a'}, 'values': [[1767225600, '1'], [1767229200, '3']]}
+        ]}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def prometheus_time(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        FakePrometheusHandler.count = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakePrometheusHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.cache_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {
+            'PROMETHEUS_URL': f"http://127.0.0.1:{self.server.server_address[1]}",
+            'PROM_CACHE': 'True',
+            'PROM_CACHE_DIR': self.cache_dir,
+            'PROM_CACHE_TTL': '60',
+            'PROM_SHARD_SAMPLES': '0',
+        })
+        self.env.start()
+        prometheus_data._cache = None
+
+    def tearDown(self):
+        prometheus_data._cache = None
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_closed_window_hit(self):
+        first = prometheus_data.query_prometheus('up', '2026-01-01T00:00:00Z', '2026-01-02T00:00:00Z')
+        second = prometheus_data.query_prometheus('up', '2026-01-01T00:00:00Z', '2026-01-02T00:00:00Z')
+        self.assertEqual(FakePrometheusHandler.count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(second['data']['result'][0]['metric'], {'pod': 'a'})
+
+    def test_open_window_ttl(self):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        start, end = prometheus_time(now - timedelta(hours=1)), prometheus_time(now)
+        prometheus_data.query_prometheus('up', start, end)
+        prometheus_data.query_prometheus('up', start, end)
+        # 包含当前时间的查询在 TTL 内命中缓存
+        self.assertEqual(FakePrometheusHandler.count, 1)
+
+        # 超过 TTL 后重新查询
+        with mock.patch('time.time', return_value=datetime.now().timestamp() + 120):
+            prometheus_data.query_prometheus('up', start, end)
+        self.assertEqual(FakePrometheusHandler.count, 2)
+
+    def test_cache_disabled(self):
+        os.environ['PROM_CACHE'] = 'False'
+        for _ in range(2):
+            prometheus_data.query_prometheus('up', '2026-01-01T00:00:00Z', '2026-01-02T00:00:00Z')
+        self.assertEqual(FakePrometheusHandler.count, 2)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+render_http.GrafanaRenderer 的测试，使用本地 http.server 模拟 Grafana 图片渲染接口
+运行: python -m pytest -q test_render_http.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from unittest import mock
+import threading
+import unittest
+import os
+
+import render_http
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 16
+
+
+class FakeRenderHandler(BaseHTTPRequestHandler):
+    """panelId=1 返回 PNG，其他面板返回 500，记录每个请求的路径、参数和认证头"""
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.requests.append({'path': url.path, 'params': params, 'auth': self.headers.get('Authorization')})
+        if params.get('panelId') == '1':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+        else:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GrafanaRendererTest(unittest.TestCase):
+    def setUp(self):
+        FakeRenderHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRenderHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.env = mock.patch.dict(os.environ, {'SCREENSHOT_TO_DISK': 'False', 'RENDER_TIMING_DIR': '.'})
+        self.env.start()
+        os.environ.pop('RENDER_TZ', None)
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_run(self):
+        renderer = render_http.GrafanaRenderer(self.url, 'token', 'dash-a', concurrency=2, width=800, height=400, timeout=5)
+        panels = [{'id': 1, 'title': '成功面板'}, {'id': 2, 'title': '失败面板', 'uid': 'dash-b'}]
+        manifest = renderer.run(panels, '2026-01-01T00:00:00.000Z', '2026-01-02T00:00:00.000Z')
+
+        self.assertEqual([m['status'] for m in manifest], ['success', 'failed'])
+        self.assertEqual([m['uid'] for m in manifest], ['dash-a', 'dash-b'])
+        self.assertEqual(renderer.images, {'成功面板': PNG})
+
+        requests = sorted(FakeRenderHandler.requests, key=lambda r: r['params']['panelId'])
+        self.assertEqual([r['path'] for r in requests], ['/render/d-solo/dash-a/', '/render/d-solo/dash-b/'])
+        self.assertTrue(all(r['auth'] == 'Bearer token' for r in requests))
+        params = requests[0]['params']
+        self.assertEqual((params['from'], params['to'], params['width'], params['height']),
+                         ('2026-01-01T00:00:00.000Z', '2026-01-02T00:00:00.000Z', '800', '400'))
+        # 没有配置 RENDER_TZ 时不发送 tz
+        self.assertNotIn('tz', params)
+
+    def test_tz(self):
+        os.environ['RENDER_TZ'] = 'Asia/Shanghai'
+        renderer = render_http.GrafanaRenderer(self.url, 'token', 'dash-a', timeout=5)
+        renderer.run([{'id': 1, 'title': '成功面板'}], 'now-1d', 'now')
+        self.assertEqual(FakeRenderHandler.requests[0]['params']['tz'], 'Asia/Shanghai')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,44 @@
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+import requests
 import pytz
+import threading
+import gzip
 import re
+import os
 
 # 当前的UTC时间
 utc_now = datetime.now(pytz.UTC)
 
 
+def get_env_int(name, default, minimum=None):
+    """读取整数环境变量，非法值时使用默认值；minimum 为允许的最小值"""
+    try:
+        value = int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f"{name} 配置错误，使用默认值: {default}")
+        value = default
+    return max(value, minimum) if minimum is not None else value
+
+
+def get_env_float(name, default):
+    """读取浮点数环境变量，非法值时使用默认值"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f"{name} 配置错误，使用默认值: {default}")
+        return default
+
+
+def new_session(pool_size):
+    """创建连接池大小为 pool_size 的 requests.Session，多个线程共用时复用 keep-alive 连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def convert_time_format(time_str):
     """
     convert_time_format 的 Docstring
@@ -72,6 +105,86 @@ def convert_to_prometheus_format(time_str):
     return time_str
 
 
+def parse_time(time_str):
+    """
+    将绝对时间字符串解析为 UTC datetime
+    支持 "2025-12-02T00:00:00.000Z" 和 "2025-12-02T00:00:00Z"，相对时间（如 "now-7d"）返回 None
+    """
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return datetime.strptime(time_str, fmt).replace(tzinfo=pytz.UTC)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_closed_window(date_from, date_to):
+    """
+    时间范围是否已经完全结束，结束的时间范围数据不会再变化
+    两端都是绝对时间，且结束时间早于当前时间减去 CACHE_CLOSED_MARGIN 秒（默认 300，留出数据写入的延迟）；
+    main*.py 会把 DATE_TO=now 转换为绝对时间，有了这个间隔，结束于当前时间的范围不会被当作已经结束
+    """
+    start = parse_time(date_from)
+    end = parse_time(date_to)
+    margin = get_env_float("CACHE_CLOSED_MARGIN", 300)
+    return start is not None and end is not None and end <= datetime.now(pytz.UTC) - timedelta(seconds=margin)
+
+
+def touch(path):
+    """更新文件的修改时间，作为 evict_lru 的最近使用时间"""
+    os.utime(path, None)
+
+
+def write_atomic(path, write, mode='wb'):
+    """
+    先写同目录下的临时文件再改名，并发读取时不会读到不完整的文件
+    write: 接收已打开文件对象的函数；mode 为 'wb' 或 gzip 的 'wt'（以 .gz 结尾的文件用 gzip 写入）
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(tmp_path, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def evict_lru(cache_dir, max_bytes):
+    """目录总大小超过 max_bytes 时，按修改时间（见 touch）从旧到新删除文件"""
+    files = []
+    total = 0
+    for foldername, subfolders, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            path = os.path.join(foldername, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    for mtime, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
+
+
+def save_screenshot(panel_name, png, screenshots_dir="screenshots"):
+    """
+    将截图写入 screenshots 目录
+    截图字节本身直接交给邮件和压缩包使用，SCREENSHOT_TO_DISK=False 时不再写磁盘
+    """
+    if os.getenv("SCREENSHOT_TO_DISK", "True") == "False":
+        return
+    os.makedirs(screenshots_dir, exist_ok=True)
+    with open(f"{screenshots_dir}/{panel_name + '.png'}", 'wb') as f:
+        f.write(png)
+    print(f"截图保存到：{screenshots_dir}/{panel_name + '.png'}")
+
+
 # 使用示例
 if __name__ == "__main__":
     time_with_ms = "2025-12-02T00:00:00.000Z"